@@ -0,0 +1,156 @@
+# bench/bench_table_stream.py
+# 对比旧的整表 dense grid 实现与流式逐行抽取的峰值内存（tracemalloc，不含 DOM 本身）。
+#
+# 用法：python bench/bench_table_stream.py --rows 100000 --cols 8
+import argparse
+import io
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from bs4 import BeautifulSoup
+
+from case_gen.row_packer import iter_row_payloads
+from mht_parser.part_index import PartIndex
+from semantics.table_semantics import _cell_text_with_assets, stream_table
+
+
+def _legacy_normalize_table_to_grid(table, part_index, image_interpreter) -> List[List[str]]:
+    # 改造前的实现（原样保留，作为基线）
+    trs = table.find_all("tr")
+    grid: List[List[Any]] = []
+    spans: List[Optional[Dict[str, Any]]] = []
+
+    for tr in trs:
+        row: List[Any] = []
+        col = 0
+        while col < len(spans):
+            sp = spans[col]
+            if sp and sp["remain"] > 0:
+                row.append(sp["value"])
+                sp["remain"] -= 1
+            else:
+                row.append("")
+            col += 1
+
+        cells = tr.find_all(["td", "th"])
+        col = 0
+        for cell in cells:
+            while col < len(row) and row[col] != "":
+                col += 1
+            if col >= len(row):
+                extend = col - len(row) + 1
+                row.extend([""] * extend)
+                spans.extend([None] * extend)
+
+            value = _cell_text_with_assets(cell, part_index, image_interpreter)
+            attrs = cell.attrs or {}
+            rowspan = int(attrs.get("rowspan") or 1)
+            colspan = int(attrs.get("colspan") or 1)
+
+            for k in range(colspan):
+                idx = col + k
+                if idx >= len(row):
+                    row.extend([""] * (idx - len(row) + 1))
+                    spans.extend([None] * (idx - len(spans) + 1))
+                row[idx] = value
+                if rowspan > 1:
+                    spans[idx] = {"remain": rowspan - 1, "value": value}
+            col += colspan
+
+        while row and row[-1] == "":
+            row.pop()
+        grid.append(row)
+
+    max_cols = max((len(r) for r in grid), default=0)
+    for r in grid:
+        if len(r) < max_cols:
+            r.extend([""] * (max_cols - len(r)))
+    return grid
+
+
+def _legacy_dump(table, part_index, sink) -> int:
+    grid = _legacy_normalize_table_to_grid(table, part_index, None)
+    schema = [x.strip() for x in grid[0]]
+    rows = []
+    for r in grid[1:]:
+        if not any((c or "").strip() for c in r):
+            continue
+        values = [c.strip() for c in r][:len(schema)]
+        values.extend([""] * (len(schema) - len(values)))
+        rows.append(dict(zip(schema, values)))
+    for i, row in enumerate(rows):
+        sink.write(json.dumps({"row_index": i, "row": row}, ensure_ascii=False) + "\n")
+    return len(rows)
+
+
+def _stream_dump(table, part_index, sink) -> int:
+    schema, rows_iter = stream_table(table, part_index, None)
+    n = 0
+    for payload in iter_row_payloads(schema, rows_iter, table_index=0):
+        sink.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        n += 1
+    return n
+
+
+def _make_html(rows: int, cols: int, malformed: bool) -> str:
+    out = ["<table>", "<tr>" + "".join(f"<th>col{c}</th>" for c in range(cols)) + "</tr>"]
+    for r in range(rows):
+        cells = []
+        for c in range(cols):
+            attrs = ""
+            if malformed and r == 0 and c == 0:
+                attrs = ' rowspan="99999" colspan="5000"'
+            elif r % 50 == 0 and c == 1:
+                attrs = ' rowspan="3"'
+            cells.append(f"<td{attrs}>r{r}c{c}</td>")
+        out.append("<tr>" + "".join(cells) + "</tr>")
+    out.append("</table>")
+    return "".join(out)
+
+
+class _NullSink(io.TextIOBase):
+    def write(self, s):
+        return len(s)
+
+
+def _measure(fn, html: str) -> Dict[str, Any]:
+    # 每次重新建 DOM：单元格抽取会改写 DOM（图片替换、子表移除）
+    table = BeautifulSoup(html, "lxml").find("table")
+    part_index = PartIndex.build([])
+
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    try:
+        n = fn(table, part_index, _NullSink())
+        error = None
+    except Exception as e:
+        n, error = 0, f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"rows": n, "seconds": round(elapsed, 3), "peak_mb": round(peak / 1e6, 2), "error": error}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=100_000)
+    ap.add_argument("--cols", type=int, default=8)
+    ap.add_argument("--malformed", action="store_true", help="第一行放一个 rowspan=99999 colspan=5000 的单元格")
+    args = ap.parse_args()
+
+    html = _make_html(args.rows, args.cols, args.malformed)
+    print(f"table: rows={args.rows} cols={args.cols} malformed={args.malformed} html={len(html) / 1e6:.1f}MB")
+    for name, fn in (("legacy_dense_grid", _legacy_dump), ("streaming", _stream_dump)):
+        print(name, _measure(fn, html))
+
+
+if __name__ == "__main__":
+    main()
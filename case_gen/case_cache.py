@@ -0,0 +1,189 @@
+# case_gen/case_cache.py
+# 按“行内容”缓存模型生成的用例：同一份规格重复上传时，只有新增/变更的行才需要再发给模型。
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from case_gen.prompt_builder import PROMPT_TEMPLATE_VERSION
+
+# 命中后需要改写成当前行的回传字段（缓存键里不含这些，行挪位置也能命中）
+_ECHO_FIELDS = ("anchor", "table_id", "row_id")
+
+
+def row_cache_key(payload: Dict[str, Any], template_version: str = PROMPT_TEMPLATE_VERSION) -> str:
+    """
+    稳定的行哈希：(anchor, schema, 按 schema 顺序的行值, 模板版本)。
+    不含 table_id/row_id/row_index —— 表格或行只是挪了位置时仍然命中。
+    """
+    schema = list(payload.get("schema") or [])
+    row = payload.get("row") or {}
+    key_obj = {
+        "anchor": payload.get("anchor"),
+        "schema": schema,
+        "values": [(row.get(c) or "").strip() for c in schema],
+        "template": template_version,
+    }
+    raw = json.dumps(key_obj, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evicted: int = 0
+    tokens_saved: int = 0
+
+    def report(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        out = asdict(self)
+        out["lookups"] = total
+        out["hit_ratio"] = round(self.hits / total, 4) if total else 0.0
+        return out
+
+
+class CaseCache:
+    """
+    SQLite 存储：key -> (模型响应 JSON, 生成时消耗的 token 数)。
+    - TTL：created_at 超过 ttl_seconds 的条目视为过期（读到即删除）
+    - LRU：条目数超过 max_entries 时按 last_access 淘汰最久未用的
+    """
+
+    def __init__(self, db_path: str,
+                 max_entries: int = 200_000,
+                 ttl_seconds: Optional[float] = 30 * 24 * 3600,
+                 template_version: str = PROMPT_TEMPLATE_VERSION):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.template_version = template_version
+        self.stats = CacheStats()
+
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS case_cache ("
+            " key TEXT PRIMARY KEY,"
+            " response TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_case_cache_access ON case_cache(last_access)")
+        self._conn.commit()
+
+    def key(self, payload: Dict[str, Any]) -> str:
+        return row_cache_key(payload, self.template_version)
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - created_at > self.ttl_seconds
+
+    def get(self, payload: Dict[str, Any], stats: Optional[CacheStats] = None) -> Optional[Dict[str, Any]]:
+        """
+        self.stats 是本实例存活期间的累计值；stats 给了就同时记一份到调用方
+        （RowDispatcher 每次 run 一份，得到单个作业的命中率）。
+        """
+        key = self.key(payload)
+        counters = [self.stats] if stats is None else [self.stats, stats]
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, tokens, created_at FROM case_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                for st in counters:
+                    st.misses += 1
+                return None
+
+            response_text, tokens, created_at = row
+            if self._expired(created_at, now):
+                self._conn.execute("DELETE FROM case_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                for st in counters:
+                    st.expired += 1
+                    st.misses += 1
+                return None
+
+            self._conn.execute("UPDATE case_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            for st in counters:
+                st.hits += 1
+                st.tokens_saved += tokens
+
+        response = json.loads(response_text)
+        for f in _ECHO_FIELDS:
+            if f in payload:
+                response[f] = payload[f]
+        return response
+
+    def put(self, payload: Dict[str, Any], response: Dict[str, Any], tokens: int = 0) -> None:
+        key = self.key(payload)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO case_cache (key, response, tokens, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(response, ensure_ascii=False), int(tokens or 0), now, now),
+            )
+            self._conn.commit()
+            self._puts_since_evict += 1
+            if self._puts_since_evict >= 1000:
+                self._evict_locked(now)
+
+    def partition(self, payloads: Iterable[Dict[str, Any]]
+                  ) -> Tuple[List[Tuple[Dict[str, Any], Dict[str, Any]]], List[Dict[str, Any]]]:
+        """拆成 (命中的 [(payload, response)], 需要发给模型的 [payload])。"""
+        hits: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        misses: List[Dict[str, Any]] = []
+        for p in payloads:
+            resp = self.get(p)
+            if resp is None:
+                misses.append(p)
+            else:
+                hits.append((p, resp))
+        return hits, misses
+
+    def _evict_locked(self, now: float) -> None:
+        self._puts_since_evict = 0
+        if self.ttl_seconds is not None:
+            cur = self._conn.execute("DELETE FROM case_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.stats.evicted += cur.rowcount
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM case_cache").fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            cur = self._conn.execute(
+                "DELETE FROM case_cache WHERE key IN"
+                " (SELECT key FROM case_cache ORDER BY last_access ASC LIMIT ?)",
+                (overflow,),
+            )
+            self.stats.evicted += cur.rowcount
+        self._conn.commit()
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evict_locked(time.time())
+
+    def write_report(self, out_path: str, stats: Optional[CacheStats] = None) -> Dict[str, Any]:
+        """
+        每个作业结束时落盘命中率和节省的 token，例如 jobs/{job_id}/outputs/case_cache_report.json。
+        stats 传该作业自己的计数；不传则是实例累计值。
+        """
+        report = (stats or self.stats).report()
+        report["template_version"] = self.template_version
+        out = Path(out_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        return report
+
+    def close(self) -> None:
+        with self._lock:
+            self._evict_locked(time.time())
+            self._conn.close()
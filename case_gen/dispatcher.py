@@ -0,0 +1,288 @@
+# case_gen/dispatcher.py
+# 把 row_payloads.jsonl 逐行发给模型：asyncio + 连接池 keep-alive，
+# 限速（RPS / TPM）、抖动退避重试、回传字段校验，结果按输入顺序写回。
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+from case_gen.case_cache import CacheStats, CaseCache
+from case_gen.prompt_builder import build_row_prompt, estimate_tokens
+
+_ECHO_FIELDS = ("anchor", "table_id", "row_id")
+_RETRY_STATUS = (408, 409, 425, 429, 500, 502, 503, 504)
+_RE_JSON_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+@dataclass
+class DispatchConfig:
+    endpoint: str                      # OpenAI 兼容的 chat/completions 地址
+    model: str
+    api_key: Optional[str] = None
+    max_concurrency: int = 16          # 同时在途的请求数，也是连接池大小
+    requests_per_second: float = 5.0
+    tokens_per_minute: int = 200_000
+    max_output_tokens: int = 2048      # TPM 预占额度 = 提示词估算 + 这个值
+    max_retries: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 30.0
+    timeout: float = 120.0
+    temperature: float = 0.2
+
+
+class RetryableError(Exception):
+    def __init__(self, msg: str, retry_after: Optional[float] = None, tokens: int = 0):
+        super().__init__(msg)
+        self.retry_after = retry_after
+        self.tokens = tokens  # 这次失败实际消耗的 token（被限流/5xx 时为 0）
+
+
+class _TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        amount = min(amount, self.capacity)  # 单次超过桶容量时按满桶处理，避免永远等不到
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def refund(self, amount: float) -> None:
+        # 预占多了（实际用量小于预估）时把差额还回去
+        self.tokens = min(self.capacity, self.tokens + max(0.0, amount))
+
+
+def iter_jsonl(path: str) -> Iterator[Dict[str, Any]]:
+    with Path(path).open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def parse_model_response(payload: Dict[str, Any], content: str) -> Dict[str, Any]:
+    """
+    解析模型输出并校验回传契约：row_id/table_id/anchor 必须与请求一致，cases 必须是数组。
+    不合格按可重试处理（模型偶发跑偏，重发通常能纠正）。
+    """
+    try:
+        resp = json.loads(_RE_JSON_FENCE.sub("", content or ""))
+    except json.JSONDecodeError as e:
+        raise RetryableError(f"response is not JSON: {e}")
+    if not isinstance(resp, dict):
+        raise RetryableError("response is not a JSON object")
+
+    for f in _ECHO_FIELDS:
+        if resp.get(f) != payload.get(f):
+            raise RetryableError(f"echo mismatch on {f}: expected {payload.get(f)!r}, got {resp.get(f)!r}")
+    if not isinstance(resp.get("cases"), list):
+        raise RetryableError("missing cases[]")
+    return resp
+
+
+class RowDispatcher:
+    def __init__(self, config: DispatchConfig, cache: Optional[CaseCache] = None):
+        self.config = config
+        self.cache = cache
+        self._rps = _TokenBucket(config.requests_per_second, max(1.0, config.requests_per_second))
+        self._tpm = _TokenBucket(config.tokens_per_minute / 60.0, float(config.tokens_per_minute))
+        self.stats: Dict[str, int] = self._new_stats()
+        self.cache_stats = CacheStats()
+
+    @staticmethod
+    def _new_stats() -> Dict[str, int]:
+        return {"rows": 0, "ok": 0, "error": 0, "cached": 0,
+                "requests": 0, "retries": 0, "tokens_used": 0}
+
+    def _new_client(self):
+        try:
+            import httpx
+        except Exception as e:
+            raise RuntimeError(f"Missing deps: {e} (pip install httpx)")
+
+        limits = httpx.Limits(max_connections=self.config.max_concurrency,
+                              max_keepalive_connections=self.config.max_concurrency)
+        headers = {"Content-Type": "application/json"}
+        if self.config.api_key:
+            headers["Authorization"] = f"Bearer {self.config.api_key}"
+        return httpx.AsyncClient(limits=limits, headers=headers, timeout=self.config.timeout)
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.config.backoff_max)
+        # full jitter
+        return random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * (2 ** attempt)))
+
+    async def _call_once(self, client, payload: Dict[str, Any], prompt: str):
+        import httpx
+
+        body = {
+            "model": self.config.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": self.config.max_output_tokens,
+            "temperature": self.config.temperature,
+        }
+        self.stats["requests"] += 1
+        try:
+            r = await client.post(self.config.endpoint, json=body)
+        except httpx.TransportError as e:
+            raise RetryableError(f"{type(e).__name__}: {e}")
+
+        if r.status_code in _RETRY_STATUS:
+            ra = r.headers.get("Retry-After")
+            raise RetryableError(f"HTTP {r.status_code}",
+                                 retry_after=float(ra) if ra and ra.replace(".", "", 1).isdigit() else None)
+        r.raise_for_status()
+
+        data = r.json()
+        content = data["choices"][0]["message"]["content"]
+        usage = (data.get("usage") or {}).get("total_tokens")
+        tokens = int(usage) if usage else estimate_tokens(prompt) + estimate_tokens(content)
+        try:
+            resp = parse_model_response(payload, content)
+        except RetryableError as e:
+            e.tokens = tokens
+            raise
+        return resp, tokens
+
+    async def _dispatch_row(self, client, payload: Dict[str, Any]) -> Dict[str, Any]:
+        prompt = build_row_prompt(payload)
+        reserve = estimate_tokens(prompt) + self.config.max_output_tokens
+
+        last_error = None
+        for attempt in range(self.config.max_retries + 1):
+            await self._rps.acquire(1)
+            await self._tpm.acquire(reserve)
+            try:
+                resp, tokens = await self._call_once(client, payload, prompt)
+            except RetryableError as e:
+                self._tpm.refund(reserve - e.tokens)
+                self.stats["tokens_used"] += e.tokens
+                last_error = str(e)
+                if attempt < self.config.max_retries:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self._backoff(attempt, e.retry_after))
+                continue
+            except Exception as e:
+                # 不可重试（4xx、响应结构不对）：用量未知，预占额度全部退回，否则 TPM 额度会被永久占掉
+                self._tpm.refund(reserve)
+                last_error = f"{type(e).__name__}: {e}"
+                break
+
+            self._tpm.refund(reserve - tokens)
+            self.stats["tokens_used"] += tokens
+            if self.cache is not None:
+                self.cache.put(payload, resp, tokens=tokens)
+            return {"row_id": payload.get("row_id"), "table_id": payload.get("table_id"),
+                    "status": "ok", "cached": False, "tokens": tokens, "response": resp}
+
+        return {"row_id": payload.get("row_id"), "table_id": payload.get("table_id"),
+                "status": "error", "cached": False, "error": last_error}
+
+    async def run(self, in_path: str, out_path: str, report_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        流式读 in_path（row_payloads.jsonl），结果按输入顺序写 out_path（JSONL）。
+        在途 + 待写回的行数有上限，大文件不会整份读进内存。
+        统计只算本次 run（缓存实例可能跨作业长期复用）；report_path 给了就把缓存报告写进去。
+        """
+        self.stats = self._new_stats()
+        self.cache_stats = CacheStats()
+        out = Path(out_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+
+        n_workers = self.config.max_concurrency
+        queue: asyncio.Queue = asyncio.Queue(maxsize=n_workers * 2)
+        done: Dict[int, Dict[str, Any]] = {}
+        done_cond = asyncio.Condition()
+        # 乱序完成的结果最多积压这么多条，超过就让 producer 等写回追上来
+        window = asyncio.Semaphore(n_workers * 8)
+
+        async def finish(seq: int, result: Dict[str, Any]) -> None:
+            async with done_cond:
+                done[seq] = result
+                done_cond.notify_all()
+
+        async def producer() -> int:
+            seq = 0
+            for payload in iter_jsonl(in_path):
+                await window.acquire()
+                cached = self.cache.get(payload, stats=self.cache_stats) if self.cache is not None else None
+                if cached is not None:
+                    await finish(seq, {"row_id": payload.get("row_id"), "table_id": payload.get("table_id"),
+                                       "status": "ok", "cached": True, "response": cached})
+                else:
+                    await queue.put((seq, payload))
+                seq += 1
+            for _ in range(n_workers):
+                await queue.put(None)
+            return seq
+
+        async def worker(client) -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                seq, payload = item
+                await finish(seq, await self._dispatch_row(client, payload))
+
+        async def writer(total_fut: "asyncio.Future[int]") -> None:
+            next_seq = 0
+            with out.open("w", encoding="utf-8") as f:
+                while True:
+                    async with done_cond:
+                        while next_seq not in done:
+                            if total_fut.done() and next_seq >= total_fut.result():
+                                return
+                            await done_cond.wait()
+                        result = done.pop(next_seq)
+                    f.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    self.stats["rows"] += 1
+                    self.stats["ok" if result["status"] == "ok" else "error"] += 1
+                    if result.get("cached"):
+                        self.stats["cached"] += 1
+                    window.release()
+                    next_seq += 1
+
+        async with self._new_client() as client:
+            prod = asyncio.create_task(producer())
+
+            async def _wake_writer(_):
+                async with done_cond:
+                    done_cond.notify_all()
+            prod.add_done_callback(lambda t: asyncio.ensure_future(_wake_writer(t)))
+
+            workers = [asyncio.create_task(worker(client)) for _ in range(n_workers)]
+            wr = asyncio.create_task(writer(prod))
+            await prod
+            await asyncio.gather(*workers)
+            await wr
+
+        report: Dict[str, Any] = dict(self.stats)
+        if self.cache is not None:
+            report["cache"] = (self.cache.write_report(report_path, stats=self.cache_stats) if report_path
+                               else self.cache_stats.report())
+        return report
+
+
+def dispatch_row_payloads(in_path: str, out_path: str, config: DispatchConfig,
+                          cache: Optional[CaseCache] = None) -> Dict[str, Any]:
+    """
+    同步入口：jobs/{job_id}/case_inputs/row_payloads.jsonl -> outputs/row_cases.jsonl，
+    本次的缓存命中报告写到同目录的 case_cache_report.json。
+    """
+    report_path = str(Path(out_path).parent / "case_cache_report.json") if cache is not None else None
+    return asyncio.run(RowDispatcher(config, cache=cache).run(in_path, out_path, report_path=report_path))
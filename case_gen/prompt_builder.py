@@ -1,6 +1,19 @@
 # case_gen/prompt_builder.py
+import re
 from typing import List, Dict, Any
 
+# 提示词模板版本：改动下面 build_row_prompt 的措辞/输出格式时必须递增，
+# case_cache 用它做缓存键的一部分，旧模板生成的结果会自然失效
+PROMPT_TEMPLATE_VERSION = "row-v1"
+
+_RE_CJK = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中文按 1 字 1 token，其余按 4 字符 1 token。"""
+    text = text or ""
+    cjk = len(_RE_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
 def build_row_prompt(payload: Dict[str, Any]) -> str:
     schema: List[str] = payload["schema"]
     row: Dict[str, str] = payload["row"]
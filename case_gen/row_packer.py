@@ -1,38 +1,65 @@
 # case_gen/row_packer.py
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterable, Iterator, List, Optional
 from pathlib import Path
 import json
 
-def make_row_payload(table, table_index: int, row_index: int) -> Dict[str, Any]:
-    """
-    table: 你的 TableBlock（含 schema/rows/meta）
-    """
-    table_id = f"T{table_index}"
-    row_id = f"{table_id}-R{row_index}"
-
-    anchor = None
-    if getattr(table, "meta", None):
-        anchor = table.meta.get("anchor")
-
+def _build_payload(table_id: str,
+                   anchor: Optional[str],
+                   schema: List[str],
+                   row_index: int,
+                   row: Dict[str, str]) -> Dict[str, Any]:
     return {
         "anchor": anchor,
         "table_id": table_id,
-        "row_id": row_id,
+        "row_id": f"{table_id}-R{row_index}",
         "row_index": row_index,
-        "schema": list(table.schema),
-        "row": dict(table.rows[row_index]),
+        "schema": list(schema),
+        "row": dict(row),
     }
 
-def dump_row_payloads(tables: List[Any], out_path: str) -> None:
+def make_row_payload(table, table_index: int, row_index: int) -> Dict[str, Any]:
     """
-    tables: TableBlock 列表（每个包含 schema, rows, meta.anchor）
-    out_path: e.g. jobs/xxx/case_inputs/row_payloads.jsonl
+    table: 你的 TableBlock（含 schema/rows/meta）
     """
+    meta = getattr(table, "meta", None) or {}
+    # 多 HTML part 时 meta.table_id 形如 P{part}-T{order}，优先使用
+    table_id = meta.get("table_id") or f"T{table_index}"
+    return _build_payload(table_id, meta.get("anchor"), table.schema, row_index, table.rows[row_index])
+
+def iter_row_payloads(schema: List[str],
+                      rows: Iterable[Dict[str, str]],
+                      table_index: int,
+                      anchor: Optional[str] = None,
+                      table_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    流式版本：rows 可以是 table_semantics.stream_table 给出的行迭代器，
+    逐行产出 payload，不需要先把整张表物化成 TableBlock。
+    """
+    table_id = table_id or f"T{table_index}"
+    for r_idx, row in enumerate(rows):
+        yield _build_payload(table_id, anchor, schema, r_idx, row)
+
+def write_row_payloads(payloads: Iterable[Dict[str, Any]], out_path: str) -> int:
+    """逐条写 JSONL，返回写出的行数。"""
     out = Path(out_path)
     out.parent.mkdir(parents=True, exist_ok=True)
 
+    n = 0
     with out.open("w", encoding="utf-8") as f:
-        for t_idx, table in enumerate(tables):
-            for r_idx in range(len(table.rows)):
-                payload: Dict[str, Any] = make_row_payload(table, table_index=t_idx, row_index=r_idx)
-                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
\ No newline at end of file
+        for payload in payloads:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+def dump_row_payloads(tables: List[Any], out_path: str) -> None:
+    """
+    tables: TableBlock 列表（每个包含 schema, rows, meta.anchor）
+    out_path: e.g. jobs/xxx/case_inputs/row_payloads.jsonl
+    """
+    write_row_payloads(
+        # table.order 是全文顶层表格序号：选择性抽取只拿到部分表格时，table_id 仍与全量一致
+        (make_row_payload(table, table_index=table.order, row_index=r_idx)
+         for table in tables
+         for r_idx in range(len(table.rows))),
+        out_path,
+    )
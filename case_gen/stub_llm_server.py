@@ -0,0 +1,72 @@
+# case_gen/stub_llm_server.py
+# 本地桩服务：模拟 OpenAI 兼容的 chat/completions，用于联调 dispatcher（限速、重试、顺序写回）。
+# 从提示词里取回 anchor/table_id/row_id 原样回传，可按比例注入 429/500 和延迟。
+#
+# 用法：python case_gen/stub_llm_server.py --port 8799 --fail-rate 0.1 --latency 0.05
+import argparse
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_RE_FIELD = re.compile(r"^(anchor|table_id|row_id): (.*)$", re.M)
+
+
+def make_handler(fail_rate: float = 0.0, latency: float = 0.0, bad_echo_rate: float = 0.0):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if latency:
+                time.sleep(latency)
+
+            if random.random() < fail_rate:
+                code = random.choice((429, 500, 503))
+                return self._send(code, {"error": "injected"}, {"Retry-After": "0.1"} if code == 429 else None)
+
+            prompt = body["messages"][-1]["content"]
+            fields = dict(_RE_FIELD.findall(prompt))
+            echo = {
+                "anchor": None if fields.get("anchor") == "None" else fields.get("anchor"),
+                "table_id": fields.get("table_id"),
+                "row_id": fields.get("row_id"),
+            }
+            if random.random() < bad_echo_rate:
+                echo["row_id"] = "WRONG"
+            content = dict(echo, cases=[{"title": f"stub case for {echo['row_id']}",
+                                         "steps": ["..."], "expected": ["..."], "priority": "P1"}])
+            return self._send(200, {
+                "choices": [{"message": {"role": "assistant", "content": json.dumps(content, ensure_ascii=False)}}],
+                "usage": {"total_tokens": len(prompt) // 2 + 50},
+            })
+
+        def _send(self, code, obj, headers=None):
+            data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=8799)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--bad-echo-rate", type=float, default=0.0)
+    ap.add_argument("--latency", type=float, default=0.0)
+    args = ap.parse_args()
+    httpd = ThreadingHTTPServer(("127.0.0.1", args.port),
+                                make_handler(args.fail_rate, args.latency, args.bad_echo_rate))
+    print(f"stub LLM on http://127.0.0.1:{args.port}/v1/chat/completions")
+    httpd.serve_forever()
@@ -0,0 +1,68 @@
+# mht_parser/charset.py
+# 字符集判定：不做逐个编码的整篇试解码，只看 BOM / MIME 头 / 文档头部的 <meta>
+import codecs
+import re
+from typing import Optional, Tuple
+
+# 只嗅探文档开头这么多字节（<meta charset> 按规范必须出现在前 1024 字节内，留点余量）
+SNIFF_BYTES = 4096
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+_RE_MIME_CHARSET = re.compile(r"""charset\s*=\s*["']?\s*([^"';\s]+)""", re.I)
+# 同时覆盖 <meta charset="x"> 和 <meta http-equiv="Content-Type" content="text/html; charset=x">
+_RE_META_CHARSET = re.compile(rb"""<meta[^>]*?charset\s*=\s*["']?\s*([A-Za-z0-9_\-:.]+)""", re.I)
+
+# WPS/Office 导出经常声明 gb2312/gbk，实际内容常超出其范围，统一按超集 gb18030 解
+_SUPERSETS = {
+    "gb2312": "gb18030",
+    "gbk": "gb18030",
+}
+
+
+def normalize_charset(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    try:
+        canon = codecs.lookup(name.strip().strip("\"'")).name
+    except LookupError:
+        return None
+    return _SUPERSETS.get(canon, canon)
+
+
+def charset_from_content_type(content_type: Optional[str]) -> Optional[str]:
+    if not content_type:
+        return None
+    m = _RE_MIME_CHARSET.search(content_type)
+    return normalize_charset(m.group(1)) if m else None
+
+
+def sniff_meta_charset(head: bytes) -> Optional[str]:
+    m = _RE_META_CHARSET.search(head[:SNIFF_BYTES])
+    return normalize_charset(m.group(1).decode("ascii", "ignore")) if m else None
+
+
+def resolve_charset(content_type: Optional[str],
+                    head: bytes,
+                    default: str = "utf-8") -> Tuple[str, str]:
+    """
+    返回 (encoding, source)，source: "bom" | "mime" | "meta" | "default"
+    优先级按 HTML 规范：BOM > 传输层(MIME Content-Type) > <meta>
+    """
+    for bom, enc in _BOMS:
+        if head.startswith(bom):
+            return enc, "bom"
+
+    enc = charset_from_content_type(content_type)
+    if enc:
+        return enc, "mime"
+
+    enc = sniff_meta_charset(head)
+    if enc:
+        return enc, "meta"
+
+    return default, "default"
@@ -0,0 +1,93 @@
+# mht_parser/html_parts.py
+# 找出归档里所有 HTML 文档 part 及其关系：
+#   - 框架页：<frame src> / <iframe src>
+#   - Excel 多 sheet 导出：主页面里的 <x:WorksheetSource HRef>（名字在 <x:Name>），
+#     或 tabstrip 页里带 target 的 <a href>（名字是链接文字）
+# 只在原始字节上跑正则，不为了找关系再做一遍 DOM 解析。
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from model.mht_model import PartRecord
+from mht_parser.charset import SNIFF_BYTES, resolve_charset
+from mht_parser.part_index import PartIndex
+
+_HTML_TYPES = ("text/html", "application/xhtml+xml")
+_HTML_SUFFIXES = (".htm", ".html", ".xhtml")
+
+_RE_FRAME = re.compile(rb"""<i?frame\b[^>]*?\bsrc\s*=\s*["']?([^"'\s>]+)""", re.I)
+_RE_WORKSHEET = re.compile(
+    rb"""<x:ExcelWorksheet>.*?<x:Name>(.*?)</x:Name>.*?<x:WorksheetSource\s+HRef\s*=\s*["']?([^"'\s>]+)""",
+    re.I | re.S,
+)
+_RE_TAB_LINK = re.compile(rb"""<a\b(?=[^>]*\btarget\s*=)[^>]*?\bhref\s*=\s*["']?([^"'\s>]+)[^>]*>(.*?)</a>""",
+                          re.I | re.S)
+_RE_TAGS = re.compile(rb"<[^>]+>")
+
+
+@dataclass
+class HtmlDocument:
+    part: PartRecord
+    role: str                      # "root" | "frame" | "sheet" | "document"
+    parent: Optional[int] = None   # 引用它的 HTML part_index
+    name: Optional[str] = None     # sheet 名
+
+
+def header_value(part: PartRecord, name: str) -> Optional[str]:
+    for k, v in (part.headers or {}).items():
+        if k.lower() == name.lower():
+            return v
+    return None
+
+
+def is_html_part(part: PartRecord) -> bool:
+    if part.content_type in _HTML_TYPES:
+        return True
+    return part.filename.lower().endswith(_HTML_SUFFIXES)
+
+
+def find_html_parts(parts: List[PartRecord]) -> List[PartRecord]:
+    return [p for p in parts if is_html_part(p)]
+
+
+def _decode_name(raw: bytes, encoding: str) -> Optional[str]:
+    name = _RE_TAGS.sub(b"", raw).decode(encoding, errors="replace").strip()
+    return name or None
+
+
+def detect_html_documents(parts: List[PartRecord], part_index: PartIndex) -> List[HtmlDocument]:
+    """
+    返回所有 HTML 文档（按 part 顺序），第一个 HTML part 视为 root。
+    需要 payload 已落盘（payload_path），否则只能按 root/document 归类。
+    """
+    html_parts = find_html_parts(parts)
+    docs: Dict[int, HtmlDocument] = {}
+    for k, p in enumerate(html_parts):
+        docs[p.part_index] = HtmlDocument(part=p, role="root" if k == 0 else "document")
+
+    for p in html_parts:
+        if not p.payload_path:
+            continue
+        data = Path(p.payload_path).read_bytes()
+        encoding, _ = resolve_charset(header_value(p, "Content-Type"), data[:SNIFF_BYTES])
+
+        links = []  # [(href, role, name)]
+        links += [(m.group(1), "frame", None) for m in _RE_FRAME.finditer(data)]
+        links += [(m.group(2), "sheet", _decode_name(m.group(1), encoding)) for m in _RE_WORKSHEET.finditer(data)]
+        links += [(m.group(1), "sheet", _decode_name(m.group(2), encoding)) for m in _RE_TAB_LINK.finditer(data)]
+
+        for href, role, name in links:
+            target = part_index.resolve(href.decode("ascii", errors="ignore"))
+            doc = docs.get(target.part_index) if target else None
+            if doc is None or doc.part.part_index == p.part_index or doc.role == "root":
+                continue
+            # sheet 优先于 frame（Excel 导出里 sheet 页同时也是 frame 的目标）
+            if doc.role in ("document", "frame"):
+                if doc.role == "document" or role == "sheet":
+                    doc.role = role
+                    doc.parent = p.part_index
+            if role == "sheet" and name and not doc.name:
+                doc.name = name
+
+    return [docs[p.part_index] for p in html_parts]
@@ -30,6 +30,11 @@ class PartIndex:
                     m[bn] = pr
         return cls(by_basename=m)
     
+    def resolve(self, ref: str) -> Optional[PartRecord]:
+        # ref 可能是相对路径/URL（frame src、sheet href 等），按 basename 查
+        bn = _basename_from_content_location(ref.strip().split("#", 1)[0])
+        return self.by_basename.get(bn) if bn else None
+
     def resolve_img(self, src: str) -> Optional[PartRecord]:
         # src可能是相对路径，去basename(这里的basename是什么)
         bn = Path(src).name
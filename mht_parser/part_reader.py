@@ -0,0 +1,212 @@
+# mht_parser/part_reader.py
+# 部件字节偏移索引（sidecar）+ mmap 随机访问：
+# 首次解析时记下每个 part 的头/体在原始 mht 里的字节范围，
+# 之后要单独重处理某个 part（比如换参数重 OCR 一张图），只需 mmap 原文件切片解码，
+# 成本 O(part 大小)，不用再跑整份 MIME 解析。
+import binascii
+import hashlib
+import json
+import mmap
+import re
+from dataclasses import dataclass, astuple
+from email.message import Message
+from pathlib import Path
+from typing import List, Optional, Union
+
+OFFSET_INDEX_NAME = "part_offsets.json"
+_FIELDS = ["part_index", "header_start", "body_start", "body_end", "transfer_encoding", "content_type"]
+
+_RE_BLANK_LINE = re.compile(rb"\r?\n\r?\n")
+
+
+@dataclass
+class PartOffset:
+    part_index: int
+    header_start: int
+    body_start: int
+    body_end: int               # 不含分隔行前的换行
+    transfer_encoding: str      # base64 / quoted-printable / 7bit / 8bit / binary
+    content_type: str
+
+
+def _delimiter_re(boundary: str) -> "re.Pattern[bytes]":
+    # RFC 2046：分隔行必须在行首，--boundary 后可带 -- 表示结束，允许尾随空白
+    b = re.escape(boundary.encode("ascii", "surrogateescape"))
+    return re.compile(rb"^--" + b + rb"(--)?[ \t]*\r?$", re.M)
+
+
+def _strip_line_break_before(buf, pos: int, floor: int) -> int:
+    # 分隔行前的 CRLF/LF 属于分隔符，不属于上一个 part 的 body
+    if pos > floor and buf[pos - 1:pos] == b"\n":
+        pos -= 1
+        if pos > floor and buf[pos - 1:pos] == b"\r":
+            pos -= 1
+    return pos
+
+
+def _body_start(buf, header_start: int, end: int) -> int:
+    if buf[header_start:header_start + 2] == b"\r\n":
+        return header_start + 2
+    if buf[header_start:header_start + 1] == b"\n":
+        return header_start + 1
+    m = _RE_BLANK_LINE.search(buf, header_start, end)
+    return m.end() if m else end
+
+
+def _scan(buf, msg: Message, header_start: int, body_start: int, body_end: int,
+          out: List[PartOffset]) -> None:
+    if not msg.is_multipart():
+        out.append(PartOffset(
+            part_index=len(out),
+            header_start=header_start,
+            body_start=body_start,
+            body_end=max(body_start, body_end),
+            transfer_encoding=str(msg.get("Content-Transfer-Encoding", "7bit")).strip().lower(),
+            content_type=msg.get_content_type(),
+        ))
+        return
+
+    boundary = msg.get_boundary()
+    subparts = msg.get_payload()
+    if not boundary:
+        raise ValueError(f"multipart without boundary at byte {header_start}")
+
+    segments = []  # [(seg_start, seg_end)]
+    seg_start: Optional[int] = None
+    for m in _delimiter_re(boundary).finditer(buf, body_start, body_end):
+        if seg_start is not None:
+            segments.append((seg_start, _strip_line_break_before(buf, m.start(), seg_start)))
+        if m.group(1):  # 结束分隔符
+            seg_start = None
+            break
+        # 跳过分隔行末尾的换行
+        seg_start = m.end() + 1 if buf[m.end():m.end() + 1] == b"\n" else m.end()
+    if seg_start is not None:
+        # 缺少结束分隔符：最后一段延续到外层 body 末尾（与 email 的宽松处理一致）
+        segments.append((seg_start, body_end))
+
+    if len(segments) != len(subparts):
+        raise ValueError(f"offset scan found {len(segments)} parts but email parsed {len(subparts)} "
+                         f"(boundary={boundary!r})")
+
+    for (s, e), sub in zip(segments, subparts):
+        _scan(buf, sub, s, _body_start(buf, s, e), e, out)
+
+
+def scan_part_offsets(buf, msg: Message) -> List[PartOffset]:
+    """
+    buf: 原始 mht 字节（bytes 或 mmap）；msg: 同一份字节解析出的 email.message。
+    返回顺序与 msg.walk() 中的非 multipart part 顺序一致，即与 PartRecord.part_index 对应。
+    """
+    out: List[PartOffset] = []
+    _scan(buf, msg, 0, _body_start(buf, 0, len(buf)), len(buf), out)
+    return out
+
+
+def _headers_digest(buf, offsets: List[PartOffset]) -> str:
+    """
+    顶层头 + 每个 part 头部字节的摘要：只读几 KB，就能发现“大小相同但内容换了”的重新导出
+    （boundary、Content-Location 会变）；不依赖 mtime，拷贝到共享存储也不误判。
+    """
+    h = hashlib.sha256()
+    h.update(buf[:offsets[0].header_start] if offsets else buf[:0])
+    for o in offsets:
+        h.update(buf[o.header_start:o.body_start])
+    return h.hexdigest()
+
+
+def write_offset_index(path: Union[str, Path], mht_path: Union[str, Path], offsets: List[PartOffset]) -> None:
+    mht_path = Path(mht_path)
+    st = mht_path.stat()
+    with mht_path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        digest = _headers_digest(mm, offsets)
+    doc = {
+        "source_file": str(mht_path),
+        "source_size": st.st_size,
+        "source_mtime_ns": st.st_mtime_ns,
+        "headers_digest": digest,
+        "fields": _FIELDS,
+        "parts": [list(astuple(o)) for o in offsets],
+    }
+    Path(path).write_text(json.dumps(doc, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+
+
+def load_offset_index(path: Union[str, Path]) -> dict:
+    doc = json.loads(Path(path).read_text(encoding="utf-8"))
+    fields = doc.get("fields") or _FIELDS
+    doc["parts"] = [PartOffset(**dict(zip(fields, row))) for row in doc["parts"]]
+    return doc
+
+
+class PartReader:
+    """
+    用 sidecar 索引 + mmap 随机读取单个 part：
+
+        with PartReader("x.mht", "structure/part_offsets.json") as r:
+            data = r.decode(12)
+
+    raw()/headers() 返回 mmap 上的 memoryview（零拷贝）。close 前需释放所有取出的 memoryview。
+    """
+
+    def __init__(self, mht_path: Union[str, Path], index_path: Union[str, Path]):
+        self.mht_path = Path(mht_path)
+        doc = load_offset_index(index_path)
+        st = self.mht_path.stat()
+        if doc.get("source_size") != st.st_size:
+            raise ValueError(f"offset index is stale: indexed {doc.get('source_size')} bytes, file has {st.st_size}")
+        self.offsets: List[PartOffset] = doc["parts"]
+
+        self._f = self.mht_path.open("rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if "headers_digest" in doc:
+                stale = _headers_digest(self._mm, self.offsets) != doc["headers_digest"]
+            else:
+                # 旧索引没有头部摘要，只能比 mtime
+                stale = doc.get("source_mtime_ns") != st.st_mtime_ns
+            if stale:
+                raise ValueError("offset index is stale: archive content changed since it was indexed")
+        except BaseException:
+            self._mm.close()
+            self._f.close()
+            raise
+        self._mv = memoryview(self._mm)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __enter__(self) -> "PartReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def headers(self, part_index: int) -> memoryview:
+        o = self.offsets[part_index]
+        return self._mv[o.header_start:o.body_start]
+
+    def raw(self, part_index: int) -> memoryview:
+        o = self.offsets[part_index]
+        return self._mv[o.body_start:o.body_end]
+
+    def decode(self, part_index: int) -> Union[bytes, memoryview]:
+        """按 Content-Transfer-Encoding 解码；7bit/8bit/binary 直接返回切片，不拷贝。"""
+        o = self.offsets[part_index]
+        body = self.raw(part_index)
+        if o.transfer_encoding == "base64":
+            return binascii.a2b_base64(body)
+        if o.transfer_encoding == "quoted-printable":
+            return binascii.a2b_qp(body)
+        return body
+
+    def write_part(self, part_index: int, out_path: Union[str, Path]) -> Path:
+        out = Path(out_path)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        with out.open("wb") as f:
+            f.write(self.decode(part_index))
+        return out
+
+    def close(self) -> None:
+        self._mv.release()
+        self._mm.close()
+        self._f.close()
@@ -1,3 +1,4 @@
+import binascii
 import hashlib
 import json
 import mimetypes
@@ -5,7 +6,7 @@ import re
 import sys
 from dataclasses import dataclass, asdict
 from pathlib import Path
-from typing import Optional, Union
+from typing import List, Optional, Union
 from urllib.parse import urlparse
 
 ROOT = Path(__file__).resolve().parents[1]
@@ -13,6 +14,7 @@ if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
 from model.mht_model import PartRecord
+from mht_parser.part_reader import OFFSET_INDEX_NAME, scan_part_offsets, write_offset_index
 
 from email.parser import BytesParser
 from email import policy
@@ -48,11 +50,122 @@ def _ensure_extension(filename: str, content_type: str) -> str:
     ext = mimetypes.guess_extension(content_type) or ""
     return filename + (ext if ext else ".bin")
 
+# 流式解码：每次处理的编码文本字符数（base64/QP 原文）
+_CHUNK_CHARS = 1 << 16
+_RE_B64_JUNK = re.compile(rb"[^A-Za-z0-9+/=]")
+
+# 可选摘要算法：sha256 默认；blake2b 更快；xxhash 需额外安装，只适合做缓存键
+_XXHASH_ALGOS = ("xxh64", "xxh3_64", "xxh3_128")
+
+
+def _resolve_hash_algo(hash_algo: str) -> str:
+    algo = (hash_algo or "sha256").strip().lower()
+    if algo == "xxhash":
+        algo = "xxh3_64"
+    if algo in ("sha256", "blake2b"):
+        return algo
+    if algo in _XXHASH_ALGOS:
+        try:
+            import xxhash  # noqa: F401
+        except ImportError as e:
+            raise ValueError(f"hash_algo={algo} requires the xxhash package: {e}")
+        return algo
+    raise ValueError(f"Unsupported hash_algo: {hash_algo}")
+
+
+def _new_hasher(algo: str):
+    if algo in _XXHASH_ALGOS:
+        import xxhash
+        return getattr(xxhash, algo)()
+    return hashlib.new(algo)
+
+
+def _payload_text_to_bytes(s: str) -> bytes:
+    # 和 email.message.get_payload(decode=True) 的处理方式保持一致
+    try:
+        return s.encode("ascii", "surrogateescape")
+    except UnicodeError:
+        return s.encode("raw-unicode-escape")
+
+
+def _iter_base64(raw: str, chunk_chars: int):
+    pending = b""
+    for start in range(0, len(raw), chunk_chars):
+        piece = pending + _RE_B64_JUNK.sub(b"", _payload_text_to_bytes(raw[start:start + chunk_chars]))
+        # base64 以 4 字符为一组，余下的留给下一块
+        cut = len(piece) - len(piece) % 4
+        if cut:
+            yield binascii.a2b_base64(piece[:cut])
+        pending = piece[cut:]
+    if pending:
+        yield binascii.a2b_base64(pending + b"=" * (-len(pending) % 4))
+
+
+def _iter_quoted_printable(raw: str, chunk_chars: int):
+    pending = b""
+    for start in range(0, len(raw), chunk_chars):
+        piece = pending + _payload_text_to_bytes(raw[start:start + chunk_chars])
+        # 软换行 "=\n" 不会跨行，按整行切块即可
+        cut = piece.rfind(b"\n") + 1
+        if cut:
+            yield binascii.a2b_qp(piece[:cut])
+            pending = piece[cut:]
+        else:
+            pending = piece
+    if pending:
+        yield binascii.a2b_qp(pending)
+
+
+def _iter_decoded_chunks(part, chunk_chars: int = _CHUNK_CHARS):
+    cte = str(part.get("Content-Transfer-Encoding", "")).strip().lower()
+    raw = part.get_payload(decode=False)
+    if isinstance(raw, str) and cte == "base64":
+        yield from _iter_base64(raw, chunk_chars)
+    elif isinstance(raw, str) and cte == "quoted-printable":
+        yield from _iter_quoted_printable(raw, chunk_chars)
+    else:
+        # 7bit/8bit/binary 本身就是原文，交给 email 处理
+        yield part.get_payload(decode=True) or b""
+
+
+def _stream_payload(part, hash_algo: str, sink=None) -> tuple[int, str]:
+    """
+    解码、哈希、写盘合并成一趟：每个 chunk 解出来就 update + write。
+    返回 (size_bytes, hexdigest)。
+    """
+    hasher = _new_hasher(hash_algo)
+    size = 0
+    try:
+        for chunk in _iter_decoded_chunks(part):
+            hasher.update(chunk)
+            size += len(chunk)
+            if sink is not None:
+                sink.write(chunk)
+    except binascii.Error:
+        # 编码不规范：退回 email 的宽松解码，重新算一遍
+        hasher = _new_hasher(hash_algo)
+        payload = part.get_payload(decode=True) or b""
+        hasher.update(payload)
+        size = len(payload)
+        if sink is not None:
+            sink.seek(0)
+            sink.truncate()
+            sink.write(payload)
+    return size, hasher.hexdigest()
+
+
 def parse_mht_to_structure(
     mht_path: Union[str, Path],
     dump_dir: Optional[Union[str, Path]] = None,
+    hash_algo: str = "sha256",
+    offset_index: bool = False,
 ) -> list[PartRecord]:
+    """
+    offset_index=True 且给了 dump_dir 时，额外写 dump_dir/part_offsets.json：
+    每个 part 在原始 mht 中的头/体字节范围和传输编码，供 PartReader 随机读取单个 part。
+    """
     mht_path = Path(mht_path)
+    hash_algo = _resolve_hash_algo(hash_algo)
     raw = mht_path.read_bytes()
     msg = BytesParser(policy=policy.default).parsebytes(raw)
 
@@ -76,10 +189,6 @@ def parse_mht_to_structure(
         content_id = part.get("Content-ID")
         headers = {k: str(v) for (k, v) in part.items()}
 
-        payload = part.get_payload(decode=True) or b""
-        size_bytes = len(payload)
-        sha256 = hashlib.sha256(payload).hexdigest()
-
         # 生成落盘文件名
         base = _filename_from_location(content_location) or f"part_{logical_index:03d}"
         base = _ensure_extension(base, content_type)
@@ -87,11 +196,17 @@ def parse_mht_to_structure(
 
         payload_path = None
         if assets_dir is not None:
+            # 摘要要等写完才知道：先写临时文件，再按 hash 前缀改名
+            tmp_path = assets_dir / f"{logical_index:03d}.partial"
+            with tmp_path.open("wb") as fh:
+                size_bytes, digest = _stream_payload(part, hash_algo, fh)
             # 用 hash 前缀 + 序号避免重名，且便于定位
-            final_name = f"{logical_index:03d}_{sha256[:10]}_{filename}"
+            final_name = f"{logical_index:03d}_{digest[:10]}_{filename}"
             out_path = assets_dir / final_name
-            out_path.write_bytes(payload)
+            tmp_path.replace(out_path)
             payload_path = str(out_path)
+        else:
+            size_bytes, digest = _stream_payload(part, hash_algo)
 
         rec = PartRecord(
             part_index=logical_index,
@@ -100,20 +215,31 @@ def parse_mht_to_structure(
             content_id=content_id,
             filename=filename,
             size_bytes=size_bytes,
-            sha256=sha256,
+            sha256=digest,
             headers=headers,
             payload_path=payload_path,
+            hash_algo=hash_algo,
         )
         parts.append(rec)
         logical_index += 1
 
     # 把结构清单落盘（不包含二进制，只保存元数据/路径）
     if dump_root:
+        offset_index_path = None
+        if offset_index:
+            offsets = scan_part_offsets(raw, msg)
+            if len(offsets) != len(parts):
+                raise ValueError(f"offset scan found {len(offsets)} parts, expected {len(parts)}")
+            offset_index_path = dump_root / OFFSET_INDEX_NAME
+            write_offset_index(offset_index_path, mht_path, offsets)
+
         manifest = {
             "source_file": str(mht_path),
             "root_content_type": msg.get_content_type(),
             "is_multipart": msg.is_multipart(),
+            "hash_algo": hash_algo,
             "part_count": len(parts),
+            "offset_index": str(offset_index_path) if offset_index_path else None,
             "parts": [asdict(p) for p in parts],
         }
         (dump_root / "manifest.json").write_text(
@@ -124,6 +250,22 @@ def parse_mht_to_structure(
     return parts
 
 
+def load_structure_manifest(dump_dir: str) -> List[PartRecord]:
+    """
+    读回 parse_mht_to_structure 写出的 manifest.json，不重新解析 mht（作业从断点续跑时用）。
+    payload_path 按 dump_dir 重新定位：共享存储在不同节点上的挂载路径可能不同。
+    """
+    dump_root = Path(dump_dir)
+    manifest = json.loads((dump_root / "manifest.json").read_text(encoding="utf-8"))
+    parts = []
+    for d in manifest["parts"]:
+        rec = PartRecord(**d)
+        if rec.payload_path:
+            rec.payload_path = str(dump_root / "parts" / Path(rec.payload_path).name)
+        parts.append(rec)
+    return parts
+
+
 # if __name__ == "__main__":
 #     parts = parse_mht_to_structure(
 #         ".\\大宽基地成就馆升级.mht",
@@ -13,6 +13,8 @@ class PartRecord:
     sha256: str
     headers: dict[str, str]
     payload_path: Optional[str] = None
+    # sha256 字段存放的是 hash_algo 算出的摘要；算法名一起记录，缓存键才不会混用
+    hash_algo: str = "sha256"
 
 
 @dataclass
@@ -1,13 +1,25 @@
 #pipeline.py
 import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import asdict, is_dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Callable, Collection, Optional, Tuple
 
-from mht_parser.structure_parser import parse_mht_to_structure
+from bs4 import BeautifulSoup
+
+from mht_parser.charset import SNIFF_BYTES, resolve_charset
+from mht_parser.structure_parser import load_structure_manifest, parse_mht_to_structure
 from mht_parser.part_index import PartIndex
-from semantics.html_semantics import extract_tables_with_anchor
-from semantics.image_semantics import OcrInterpreter
+from mht_parser.html_parts import HtmlDocument, detect_html_documents, find_html_parts, header_value
+from semantics.html_semantics import TableQuery, extract_tables_with_anchor, filter_table_blocks
+from semantics.context_semantics import extract_non_table_text_context
+from semantics.image_semantics import CachingInterpreter, create_interpreter
+from semantics.table_diff import diff_tables, iter_delta_row_payloads, load_job_tables, load_tables_json
+from case_gen.row_packer import write_row_payloads
 from model.mht_model import PartRecord
 
 def _dump_json(path: Path, obj: Any) -> None:
@@ -21,76 +33,211 @@ def _dump_json(path: Path, obj: Any) -> None:
     path.write_text(json.dumps(obj,ensure_ascii=False,indent=2, default=default),encoding = "utf-8")
 
 def _find_root_html_part(parts: List[PartRecord]) -> Optional[PartRecord]:
-    for p in parts:
-        if p.content_type == "text/html":
-            return p
-        
-    for p in parts:
-        if p.filename.lower().endswith(".html"):
-            return p
-    return None
-
-def _load_html(root_part: PartRecord) -> str:
+    html_parts = find_html_parts(parts)
+    return html_parts[0] if html_parts else None
+
+def _load_html_bytes(root_part: PartRecord) -> Tuple[bytes, str, str]:
+    """
+    返回 (html_bytes, encoding, charset_source)。
+    不在 Python 里整篇 decode：字节 + 编码直接交给 lxml。
+    """
     if not root_part.payload_path:
         raise RuntimeError("root HTML part has no payload_path. Enable dump_dir so payloads are written.")
-    
-    html_bytes = Path(root_part.payload_path).read_bytes()
 
-    for enc in ("utf-8","utf-8-sig", "gb18030", "latin1"):
-        try:
-            return html_bytes.decode(enc)
-        except Exception:
-            continue
+    path = Path(root_part.payload_path)
+    with path.open("rb") as f:
+        head = f.read(SNIFF_BYTES)
+    encoding, source = resolve_charset(header_value(root_part, "Content-Type"), head)
+
+    return path.read_bytes(), encoding, source
+
+# ---------------- 多 HTML part 并行抽取 ----------------
+# 子进程里的共享状态：PartIndex 和带磁盘缓存的 OCR 解释器，每个进程初始化一次
+_WORKER_PART_INDEX: Optional[PartIndex] = None
+_WORKER_OCR = None
 
-    return html_bytes.decode("utf-8",errors="replace")
+def _init_html_worker(part_index: PartIndex, engine: str, lang: str,
+                      cache_dir: str, digests: Dict[str, Tuple[str, str]]) -> None:
+    global _WORKER_PART_INDEX, _WORKER_OCR
+    _WORKER_PART_INDEX = part_index
+    _WORKER_OCR = CachingInterpreter(create_interpreter(engine, lang=lang), cache_dir, digests)
+
+def _extract_html_document(doc: HtmlDocument, query: Optional[TableQuery],
+                           part_index: Optional[PartIndex] = None, ocr=None) -> Dict[str, Any]:
+    """抽取单个 HTML part 的表格和正文上下文，表格 meta 打上来源 part。"""
+    part_index = part_index or _WORKER_PART_INDEX
+    ocr = ocr or _WORKER_OCR
+
+    html_bytes, encoding, source = _load_html_bytes(doc.part)
+    # 只解析一次：正文上下文先在原树上读（只读），表格抽取再在同一棵树上做。
+    # 带 query 的选择性抽取只要表格，不付整篇正文抽取的成本
+    soup = BeautifulSoup(html_bytes, "lxml", from_encoding=encoding)
+    context = [] if query is not None else extract_non_table_text_context(soup)
+    tables = extract_tables_with_anchor(soup, part_index, image_interpreter=ocr, query=query)
+
+    pid = doc.part.part_index
+    for t in tables:
+        t.meta = dict(t.meta or {})
+        # table.order 只在单个 part 内唯一，table_id 带上来源 part 才能在整个归档里唯一
+        t.meta.update({"table_id": f"P{pid}-T{t.order}", "source_part": pid,
+                       "html_role": doc.role, "sheet": doc.name})
+    for c in context:
+        c.meta = {**(c.meta or {}), "source_part": pid}
+
+    return {
+        "tables": tables,
+        "context": context,
+        "info": {"part_index": pid, "role": doc.role, "parent": doc.parent, "name": doc.name,
+                 "filename": doc.part.filename, "charset": encoding, "charset_source": source,
+                 "table_count": len(tables)},
+    }
 
-def run_pipeline(mht_path: str, job_dir: str) -> None:
+def _extract_all_documents(docs: List[HtmlDocument], part_index: PartIndex, parts: List[PartRecord],
+                           cache_dir: Path, image_interpreter, ocr_engine: str,
+                           query: Optional[TableQuery], html_workers: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    多个 HTML part 用进程池并行抽取（各进程共享同一个 OCR 磁盘缓存），结果按 part 顺序返回。
+    传入了 image_interpreter（常驻服务已预热）或只有一个 part 时在当前进程内顺序跑。
+    """
+    lang = "chi_sim+eng"
+    digests = {p.payload_path: (p.hash_algo, p.sha256) for p in parts if p.payload_path and p.sha256}
+    workers = html_workers or min(len(docs), os.cpu_count() or 1)
+
+    if image_interpreter is not None or workers <= 1 or len(docs) <= 1:
+        inner = image_interpreter or create_interpreter(ocr_engine, lang=lang)
+        ocr = CachingInterpreter(inner, cache_dir, digests)
+        return [_extract_html_document(d, query, part_index, ocr) for d in docs]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_html_worker,
+                             initargs=(part_index, ocr_engine, lang, str(cache_dir), digests)) as ex:
+        return list(ex.map(_extract_html_document, docs, [query] * len(docs)))
+
+# 作业的阶段划分：分布式 worker 按阶段记录 checkpoint，崩溃后从最后完成的阶段之后续跑。
+# 每个阶段的产物都在阶段结束时才算数，中途失败的阶段重跑时整体覆盖。
+PIPELINE_STAGES = ("structure", "semantics", "diff", "blocks")
+
+def run_pipeline(mht_path: str, job_dir: str, image_interpreter=None,
+                 ocr_engine: str = "tesseract",
+                 query: Optional[TableQuery] = None,
+                 prev_job_dir: Optional[str] = None,
+                 html_workers: Optional[int] = None,
+                 completed_stages: Collection[str] = (),
+                 on_stage_done: Optional[Callable[[str, float], None]] = None,
+                 fence: Optional[Callable[[str], None]] = None) -> None:
+    """
+    image_interpreter: 常驻服务里由 worker 预热后传入，避免每个文档重新初始化 OCR
+    ocr_engine: 没传 image_interpreter 时，从引擎注册表创建（tesseract / rapidocr / vision_stub）
+    query: 只抽取部分表格（如只重新生成某一章节的用例）；None 为全量。对每个 HTML part 分别生效。
+           带 query 的结果写到 semantics/query/，不覆盖全量的 semantics/tables.json（下一版本 diff 的基线）
+    prev_job_dir: 同一份规格上一版本的作业目录；给了就输出版本 diff 和只含增量行的 payload。
+                  和 query 同时给时，上一版本的表格也按同一个 query 过滤后再比
+    html_workers: 多个 HTML part（框架页、多 sheet 导出）并行抽取的进程数；None 按 CPU 数，1 为顺序
+    completed_stages: 已完成的阶段（见 PIPELINE_STAGES），直接复用磁盘上的产物
+    on_stage_done: 每个阶段完成后回调 (stage, duration_ms)；抛异常会中止后续阶段
+    fence: 每个阶段把产物写进 job_dir 之前回调 (stage)；抛异常则不写。分布式 worker 在这里做带租约条件的续租，
+           租约已被回收的旧节点算完了也写不进共享目录，不会覆盖新持有者的产物
+    """
     job_root = Path(job_dir)
     job_root.mkdir(parents=True, exist_ok=True)
+    done = set(completed_stages)
+    sem_dir = job_root / "semantics" / "query" if query is not None else job_root / "semantics"
+
+    def _fence(stage: str) -> None:
+        if fence:
+            fence(stage)
+
+    def _finish(stage: str, t0: float) -> None:
+        if on_stage_done:
+            on_stage_done(stage, (time.perf_counter() - t0) * 1000)
 
     # 1) 结构解析 + parts 落盘 + manifest.json
-    parts = parse_mht_to_structure(mht_path, dump_dir=str(job_root / "structure"))
+    t0 = time.perf_counter()
+    if "structure" in done:
+        parts = load_structure_manifest(str(job_root / "structure"))
+    else:
+        # 之前崩溃/被回收的尝试会留下 structure.*.tmp：先确认租约仍在手，再清掉这些残留
+        # （旧持有者已失去租约，它的 fence 不会再通过，删掉它正在写的目录也无妨）
+        _fence("structure")
+        for stale in job_root.glob("structure.*.tmp"):
+            shutil.rmtree(stale, ignore_errors=True)
+        # parts 边解析边落盘：先写到本次尝试独占的临时目录，过了 fence 再整体换成 structure/
+        staging =job_root / f"structure.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            parse_mht_to_structure(mht_path, dump_dir=str(staging))
+            _fence("structure")
+            shutil.rmtree(job_root / "structure", ignore_errors=True)
+            staging.rename(job_root / "structure")
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        # payload_path 按最终目录重新定位
+        parts = load_structure_manifest(str(job_root / "structure"))
+        _finish("structure", t0)
 
-    # 2) 建资源索引（img src -> part）
-    part_index = PartIndex.build(parts)
+    t0 = time.perf_counter()
+    if "semantics" in done:
+        tables = load_tables_json(str(sem_dir / "tables.json"))
+    else:
+        # 2) 建资源索引（img src -> part）
+        part_index = PartIndex.build(parts)
 
-    # 3) 找 root HTML 并加载
-    root_html = next((p for p in parts if p.content_type == "text/html"), None)
-    if not root_html or not root_html.payload_path:
-        raise RuntimeError("root HTML not found or not dumped to disk")
-    html_bytes = Path(root_html.payload_path).read_bytes()
-    html = html_bytes.decode("utf-8", errors="replace")
+        # 3) 找出所有 HTML 文档 part（root / frame / sheet）
+        docs = detect_html_documents(parts, part_index)
+        if not docs or not docs[0].part.payload_path:
+            raise RuntimeError("root HTML not found or not dumped to disk")
 
-    # 4) OCR 解释器（先跑通：全用 OCR）
-    ocr = OcrInterpreter(engine="tesseract", lang="chi_sim+eng")
+        # 4) 语义：每个 HTML part 抽顶层表格 + anchor + 正文上下文，按 part 顺序合并
+        results = _extract_all_documents(docs, part_index, parts, job_root / "structure" / "ocr_cache",
+                                         image_interpreter, ocr_engine, query, html_workers)
+        tables = [t for r in results for t in r["tables"]]
+        context = [c for r in results for c in r["context"]]
 
-    # 5) 语义提取（blocks）
-    # 4) 语义：只抽顶层表格 + anchor
-    tables = extract_tables_with_anchor(html, part_index, image_interpreter=ocr)
-    blocks = tables
-    
+        # 5) 诊断信息：计数 + 未映射图片
+        img_placeholders = 0
+        for t in tables:
+            for row in t.rows:
+                for v in row.values():
+                    if isinstance(v, str) and "[IMG:" in v:
+                        img_placeholders += v.count("[IMG:")
 
-    # 6) 诊断信息：计数 + 未映射图片
-    img_placeholders = 0
-    for t in tables:
-        for row in t.rows:
-            for v in row.values():
-                if isinstance(v, str) and "[IMG:" in v:
-                    img_placeholders += v.count("[IMG:")
-
-    diagnostics: Dict[str, Any] = {
-        "table_count": len(tables),
-        "rows_per_table": [len(t.rows) for t in tables],
-        "img_placeholders": img_placeholders,
-        "anchors": [t.meta.get("anchor") if t.meta else None for t in tables],
-    }
-    sem_dir = job_root / "semantics"
-    _dump_json(sem_dir / "tables.json", tables)
-    _dump_json(sem_dir / "diagnostics.json", diagnostics)
+        root_info = results[0]["info"]
+        diagnostics: Dict[str, Any] = {
+            "table_count": len(tables),
+            "rows_per_table": [len(t.rows) for t in tables],
+            "table_ids": [t.meta.get("table_id") for t in tables],
+            "img_placeholders": img_placeholders,
+            "anchors": [t.meta.get("anchor") if t.meta else None for t in tables],
+            "section_paths": [t.meta.get("section_path") if t.meta else None for t in tables],
+            "charset": root_info["charset"],
+            "charset_source": root_info["charset_source"],
+            "html_parts": [r["info"] for r in results],
+            "query": query,
+        }
+        _fence("semantics")
+        _dump_json(sem_dir / "context.json", context)
+        _dump_json(sem_dir / "diagnostics.json", diagnostics)
+        # tables.json 最后写：续跑时以它作为 semantics 阶段的产物
+        _dump_json(sem_dir / "tables.json", tables)
+        _finish("semantics", t0)
+
+    # 6) 与上一版本对比：只有新增/变更的行需要再生成用例
+    t0 = time.perf_counter()
+    if prev_job_dir and "diff" not in done:
+        diff = diff_tables(filter_table_blocks(load_job_tables(prev_job_dir), query), tables)
+        diff["prev_job_dir"] = str(prev_job_dir)
+        _fence("diff")
+        _dump_json(sem_dir / "table_diff.json", diff)
+        write_row_payloads(iter_delta_row_payloads(tables, diff),
+                           str(job_root / "case_inputs" /
+                               ("row_payloads_delta_query.jsonl" if query is not None else "row_payloads_delta.jsonl")))
+        _finish("diff", t0)
 
     # 7) 语义结果落盘
-    # sem_dir = job_root / "semantics"
-    _dump_json(sem_dir / "blocks.json", blocks)
+    t0 = time.perf_counter()
+    if "blocks" not in done:
+        blocks = tables
+        _fence("blocks")
+        _dump_json(sem_dir / "blocks.json", blocks)
+        _finish("blocks", t0)
 
     # tables_only = [b for b in blocks if getattr(b, "kind", None) == "table"]
     # _dump_json(sem_dir / "tables.json", tables_only)
@@ -2,7 +2,7 @@
 
 import re
 from dataclasses import dataclass
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Union
 from bs4 import BeautifulSoup, Tag
 
 @dataclass
@@ -32,16 +32,17 @@ def _is_container_block(node: Tag) -> bool:
     return False
 
 def _text_without_tables(node: Tag) -> str:
-    tmp = BeautifulSoup(str(node), "lxml")
-    root = tmp.find(node.name) or tmp
-    for t in root.find_all("table"):
-        t.decompose()
-    return root.get_text(" ", strip=True)
+    # 直接在原树上跳过表格内的文本，不再把每个块序列化后重新解析一遍
+    if node.find("table") is None:
+        return node.get_text(" ", strip=True)
+    return " ".join(t.strip() for t in node.strings if t.strip() and t.find_parent("table") is None)
 
-def extract_non_table_text_context(html: str,
+def extract_non_table_text_context(html: Union[str, bytes, BeautifulSoup],
                                    max_blocks: int = 200,
-                                   min_len: int = 2) -> List[ContextTextBlock]:
-    soup = BeautifulSoup(html, "lxml")
+                                   min_len: int = 2,
+                                   from_encoding: Optional[str] = None) -> List[ContextTextBlock]:
+    # 传入已解析好的 soup 时直接复用（pipeline 与表格抽取共用一次解析）；只读，不修改 DOM
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, "lxml", from_encoding=from_encoding)
     body = soup.body or soup
 
     blocks: List[ContextTextBlock] = []
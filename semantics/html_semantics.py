@@ -1,18 +1,16 @@
 #不做复杂重新排序，先按抽取顺序为序
 # semantics/html_semantics.py
+import bisect
 import re
 from dataclasses import dataclass
-from typing import Optional, List, Protocol, Dict, Any
+from typing import Iterator, Optional, List, Dict, Any, Tuple, Union
 
 from bs4 import BeautifulSoup, Tag
 
 from model.mht_model import PartRecord, TableBlock
 from mht_parser.part_index import PartIndex
-from semantics.table_semantics import extract_table_blocks
-
-class ImageInterpreter(Protocol):
-    def interpret(self, image_path: str) -> Optional[str]:
-        ... #为什么可以这样
+from semantics.image_semantics import ImageInterpreter
+from semantics.table_semantics import extract_table_blocks, peek_table_schema, stream_table
 
 @dataclass
 class Block:
@@ -39,93 +37,261 @@ def _shorten(s: str, max_len: int = 60) -> str:
         return s
     return s[: max_len].strip() + "..."
 
-def _extract_anchor_for_table(table: Tag, lookback_blocks: int = 3) -> Dict[str, Any]:
+_BLOCK_TAGS = ("p", "div", "li", "h1", "h2", "h3", "h4", "h5", "h6")
+_HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+_RE_WS = re.compile(r"\s+")
+_RE_NUM_JOIN = re.compile(r"(\d+)\s*[、.]\s*")  # 只覆盖 1、 / 1. 两类
+# 层级序号：2、xxx -> 1 级；2.3 yyy -> 2 级；2.3.1 zzz -> 3 级
+_RE_SECTION_NO = re.compile(r"^\s*(\d+(?:\s*\.\s*\d+)*)")
+
+def _norm_ws(s: str) -> str:
+    return _RE_WS.sub(" ", (s or "").strip())
+
+def _norm_anchor(s: str) -> str:
+    s = _norm_ws(s)                  # 多空白合一
+    s = _RE_NUM_JOIN.sub(r"\1、", s) # 统一成 1、xxx（你也可以改成保留 .）
+    return s
+
+@dataclass
+class OutlineEntry:
+    pos: int                  # 文档顺序位置（一次前向遍历的计数）
+    text: str
+    bold: bool
+    numbered: bool
+    section_path: List[str]   # 该块之后生效的章节路径
+
+class DocumentOutline:
     """
-    返回:
-      {
-        "anchor": str or None,
-        "anchor_source": "bold_nearby" | "numbered_fallback" | "none",
-        "anchor_candidates": [ ... ],
-      }
+    一次前向遍历建立的文档大纲：记录表格外的非空叶子块（加粗/带序号标记）以及顶层表格的位置。
+    表格的 anchor / 章节路径通过二分查找得到，不再对每个表格向前逐个 sibling 取文本。
     """
-    candidates: List[str] = []
 
-    # 只在“块级节点”里向前找：优先 p/div/li/标题
-    block_tags = ("p", "div", "li", "h1", "h2", "h3", "h4", "h5", "h6")
-    prev_blocks: List[Tag] = []
-    cur = table
+    def __init__(self, entries: List[OutlineEntry], tables: List[Tag], table_pos: Dict[int, int]):
+        self.entries = entries
+        self.tables = tables  # 顶层表格，文档顺序
+        self._positions = [e.pos for e in entries]
+        self._table_pos = table_pos
 
-    # 取 table 的前置 sibling 块（最多 lookback_blocks 个）
-    while len(prev_blocks) < lookback_blocks:
-        cur = cur.find_previous_sibling()
-        if cur is None:
-            break
+    @classmethod
+    def build(cls, root: Tag) -> "DocumentOutline":
+        entries: List[OutlineEntry] = []
+        tables: List[Tag] = []
+        table_pos: Dict[int, int] = {}
+        numbered_stack: List[tuple] = []  # [(序号元组, text)]，层级 = len(序号元组)
+        bold_leaf: Optional[str] = None
 
-        if isinstance(cur, Tag) and cur.name in block_tags:
-            txt = cur.get_text(" ", strip=True)
-            if txt:
-                prev_blocks.append(cur)
-
-    # for blk in prev_blocks:
-    #     bold = blk.find(["strong", "b"])
-    #     if bold:
-    #         bt = bold.get_text(" ", strip=True)
-    #         if bt:
-    #             candidates.append(bt)
-
-    _RE_WS = re.compile(r"\s+")
-    _RE_NUM_JOIN = re.compile(r"(\d+)\s*[、.]\s*")  # 只覆盖 1、 / 1. 两类
-
-    def _norm_anchor(s: str) -> str:
-        s = (s or "").strip()
-        s = _RE_WS.sub(" ", s)           # 多空白合一
-        s = _RE_NUM_JOIN.sub(r"\1、", s) # 统一成 1、xxx（你也可以改成保留 .）
-        return s
+        pos = 0
+        for node in root.find_all(_BLOCK_TAGS + ("table",)):
+            pos += 1
+            if node.find_parent("table") is not None:
+                continue
+            if node.name == "table":
+                tables.append(node)
+                table_pos[id(node)] = pos
+                continue
+            # 容器块（内部还有块级标签）跳过，只看叶子块，避免同一段文字记两次
+            if node.find(_BLOCK_TAGS) is not None:
+                continue
 
-    for blk in prev_blocks:
-        # 只要块里出现过 b/strong，就认为它是“加粗候选块”
-        if blk.find(["strong", "b"]) is not None:
-            full = _norm_anchor(blk.get_text(" ", strip=True))
-            if full:
-                candidates.append(full)
-        
-
-    for blk in prev_blocks:
-        txt = blk.get_text(" ", strip=True)
-        if txt and RE_NUMBERED.match(txt):
-            candidates.append(txt)
-    
-    if candidates:
-        anchor = _shorten(candidates[0], 80)
-        return {"anchor": anchor, "anchor_source": "numbered_fallback", "anchor_candidates": candidates}
+            if node.find("table") is None:
+                txt = _norm_ws(node.get_text(" ", strip=True))
+                bold = node.name in _HEADING_TAGS or node.find(["strong", "b"]) is not None
+            else:
+                # WPS/Word 常把表格包在 <div align=center> 里：表格自身的文字和加粗不能当成标题/anchor
+                txt = _norm_ws(" ".join(t for t in node.strings if t.find_parent("table") is None))
+                bold = node.name in _HEADING_TAGS or any(b.find_parent("table") is None
+                                                         for b in node.find_all(["strong", "b"]))
+            if not txt:
+                continue
+
+            numbered = RE_NUMBERED.match(txt) is not None
+
+            heading = False
+            if numbered:
+                m = _RE_SECTION_NO.match(txt)
+                nums = tuple(n.strip() for n in m.group(1).split(".")) if m else ("",)
+                # 弹出同级及更深的节后，剩下的栈顶应是它的上一级（2.3 挂在 2、 下）
+                keep = [e for e in numbered_stack if len(e[0]) < len(nums)]
+                extends = len(nums) > 1 and bool(keep) and keep[-1][0] == nums[:-1]
+                # 只有标题（加粗/h*）或能接上当前章节编号的序号块才入栈；
+                # 普通的 "1. 输入错误密码" 这类步骤段落只作为 anchor 候选，不改变章节路径
+                if bold or extends:
+                    numbered_stack[:] = keep + [(nums, _shorten(txt, 80))]
+                    bold_leaf = None
+                    heading = True
+            if bold and not heading:
+                # 不带序号的加粗标题挂在当前序号路径末尾，遇到下一个标题即替换
+                bold_leaf = _shorten(txt, 80)
+
+            path = [t for _, t in numbered_stack]
+            if bold_leaf:
+                path.append(bold_leaf)
+            entries.append(OutlineEntry(pos=pos, text=txt, bold=bold, numbered=numbered, section_path=path))
+
+        return cls(entries, tables, table_pos)
+
+    def _preceding(self, table: Tag) -> int:
+        """table 之前最后一个块在 entries 中的下标 + 1（O(log n)）。"""
+        pos = self._table_pos.get(id(table))
+        if pos is None:
+            return 0
+        return bisect.bisect_left(self._positions, pos)
+
+    def section_path(self, table: Tag) -> List[str]:
+        i = self._preceding(table)
+        return list(self.entries[i - 1].section_path) if i else []
+
+    def anchor_for(self, table: Tag, lookback_blocks: int = 3) -> Dict[str, Any]:
+        """
+        返回:
+          {
+            "anchor": str or None,
+            "anchor_source": "bold_nearby" | "numbered_fallback" | "none",
+            "anchor_candidates": [ ... ],
+            "section_path": "2、xxx > 2.3 yyy" or None,
+          }
+        """
+        i = self._preceding(table)
+        # 由近到远取表格前最多 lookback_blocks 个非空块
+        prev_blocks = self.entries[max(0, i - lookback_blocks):i][::-1]
+
+        bold = [_norm_anchor(e.text) for e in prev_blocks if e.bold]
+        numbered = [e.text for e in prev_blocks if e.numbered]
+        candidates = [c for c in bold if c] + numbered
+
+        path = self.section_path(table)
+        section_path = " > ".join(path) if path else None
+
+        if bold:
+            return {"anchor": _shorten(bold[0], 80), "anchor_source": "bold_nearby",
+                    "anchor_candidates": candidates, "section_path": section_path}
+        if numbered:
+            return {"anchor": _shorten(numbered[0], 80), "anchor_source": "numbered_fallback",
+                    "anchor_candidates": candidates, "section_path": section_path}
+        return {"anchor": None, "anchor_source": "none", "anchor_candidates": [], "section_path": section_path}
+
+@dataclass
+class TableQuery:
+    """
+    选择性抽取的过滤条件（都为 None 时等价于全量抽取）。
+    anchor / 表头在抽单元格、做 OCR 之前就判定，不命中的表格不付任何抽取成本。
+    """
+    anchor_regex: Optional[str] = None              # 对 anchor 或 section_path 做 re.search
+    index_range: Optional[Tuple[int, int]] = None   # 顶层表格序号 [start, end)
+    schema_contains: Optional[List[str]] = None     # 表头需包含这些列（子串匹配）
+    max_tables: Optional[int] = None                # 命中这么多张后停止遍历
+
+    def __post_init__(self):
+        self._anchor_re = re.compile(self.anchor_regex) if self.anchor_regex else None
+
+    def index_ok(self, index: int) -> bool:
+        if not self.index_range:
+            return True
+        start, end = self.index_range
+        return start <= index < end
+
+    def past_range(self, index: int) -> bool:
+        return bool(self.index_range) and index >= self.index_range[1]
+
+    def anchor_ok(self, anchor_meta: Dict[str, Any]) -> bool:
+        if self._anchor_re is None:
+            return True
+        return any(t and self._anchor_re.search(t)
+                   for t in (anchor_meta.get("anchor"), anchor_meta.get("section_path")))
+
+    def header_ok(self, header: List[str]) -> bool:
+        if not self.schema_contains:
+            return True
+        return all(any(want in col for col in header) for want in self.schema_contains)
+
+    def schema_ok(self, table: Tag) -> bool:
+        if not self.schema_contains:
+            return True
+        return self.header_ok(peek_table_schema(table))
+
+def filter_table_blocks(tables: List[TableBlock], query: Optional[TableQuery]) -> List[TableBlock]:
+    """
+    对已抽取好的 TableBlock（如上一版本作业的 tables.json）套用同一个 query，判定规则同 _select_tables；
+    max_tables 按来源 HTML part 分别计数（与逐 part 抽取一致）。
+    """
+    if query is None:
+        return list(tables)
+    matched: Dict[Any, int] = {}
+    out: List[TableBlock] = []
+    for t in tables:
+        meta = t.meta or {}
+        part = meta.get("source_part")
+        if not query.index_ok(t.order) or not query.anchor_ok(meta) or not query.header_ok(t.schema):
+            continue
+        if query.max_tables is not None and matched.get(part, 0) >= query.max_tables:
+            continue
+        matched[part] = matched.get(part, 0) + 1
+        out.append(t)
+    return out
 
-    return {"anchor": None, "anchor_source": "none", "anchor_candidates": []}
+def _select_tables(outline: DocumentOutline,
+                   query: Optional[TableQuery]) -> Iterator[Tuple[int, Tag, Dict[str, Any]]]:
+    """按文档顺序产出 (顶层序号, table, anchor_meta)；order 始终是全文中的顶层序号，过滤后 table_id 也稳定。"""
+    matched = 0
+    for order, table in enumerate(outline.tables):
+        if query is not None:
+            if query.past_range(order):
+                break
+            if not query.index_ok(order):
+                continue
 
-def extract_tables_with_anchor(html: str,
+        anchor_meta = outline.anchor_for(table, lookback_blocks=3)
+
+        if query is not None:
+            if not query.anchor_ok(anchor_meta) or not query.schema_ok(table):
+                continue
+
+        yield order, table, anchor_meta
+
+        matched += 1
+        if query is not None and query.max_tables is not None and matched >= query.max_tables:
+            break
+
+def extract_tables_with_anchor(html: Union[str, bytes, BeautifulSoup],
                                 part_index: PartIndex,
-                                image_interpreter: Optional[ImageInterpreter] = None) -> List[TableBlock]:
-    
-    soup = BeautifulSoup(html, "lxml")
+                                image_interpreter: Optional[ImageInterpreter] = None,
+                                from_encoding: Optional[str] = None,
+                                query: Optional[TableQuery] = None) -> List[TableBlock]:
+    # html 传 bytes + from_encoding 时，bs4 会把原始字节和编码直接交给 lxml 解码；
+    # 也可以直接传已解析的 soup（抽取过程会改动表格内部的 DOM）
+    soup = html if isinstance(html, BeautifulSoup) else BeautifulSoup(html, "lxml", from_encoding=from_encoding)
     tables: List[TableBlock] = []
 
-    order = 0
-    for table in soup.find_all("table"):
-        #只抽取顶层table
-        if table.find_parent("table") is not None:
-            continue
-            
-        anchor_meta = _extract_anchor_for_table(table, lookback_blocks=3)
+    outline = DocumentOutline.build(soup)
 
+    # 只抽取顶层table：outline 在抽取前就确定好列表，避免 cell 处理 decompose 子表后子表被误判为顶层
+    for order, table, anchor_meta in _select_tables(outline, query):
         tb = extract_table_blocks(table, order, part_index, image_interpreter)
 
         tb.meta = tb.meta or {}
         tb.meta.update(anchor_meta)
 
         tables.append(tb)
-        order += 1
 
     return tables
 
+def stream_tables_with_anchor(html: Union[str, bytes],
+                              part_index: PartIndex,
+                              image_interpreter: Optional[ImageInterpreter] = None,
+                              from_encoding: Optional[str] = None,
+                              query: Optional[TableQuery] = None,
+                              ) -> Iterator[Tuple[int, Dict[str, Any], List[str], Iterator[Dict[str, str]]]]:
+    """
+    大表流式版本：逐个顶层表格产出 (order, anchor_meta, schema, rows_iter)。
+    rows_iter 惰性抽取单元格（含 OCR），下游边读边写 JSONL，不物化整张表。
+    """
+    soup = BeautifulSoup(html, "lxml", from_encoding=from_encoding)
+    outline = DocumentOutline.build(soup)
+
+    for order, table, anchor_meta in _select_tables(outline, query):
+        schema, rows_iter = stream_table(table, part_index, image_interpreter)
+        yield order, anchor_meta, schema, rows_iter
+
 # def extract_blocks(
 #         html: str,
 #         part_index: PartIndex,
@@ -1,80 +1,349 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Protocol, Sequence, Tuple, Union
 
-from typing import Optional
 from model.mht_model import OcrResult
 
-import shutil 
 # semantics/image_semantics.py
-class OcrInterpreter:
+# 图片引用：落盘路径，或直接给字节（bytes / memoryview，例如 PartReader.decode 的结果）
+ImageRef = Union[str, Path, bytes, bytearray, memoryview]
+
+
+class ImageInterpreter(Protocol):
+    """统一的图片解释接口：table_semantics / html_semantics 只依赖这个协议。"""
+
+    def interpret(self, image: ImageRef) -> str:
+        ...
+
+    def interpret_batch(self, images: Sequence[ImageRef]) -> List[str]:
+        ...
+
+
+# ---------------- 引擎注册表 ----------------
+_ENGINES: Dict[str, Callable[..., ImageInterpreter]] = {}
+
+
+def register_engine(name: str):
+    """装饰器：把引擎类/工厂注册到名字下，create_interpreter(name) 即可创建。"""
+    def deco(factory):
+        _ENGINES[name] = factory
+        return factory
+    return deco
+
+
+def available_engines() -> List[str]:
+    return sorted(_ENGINES)
+
+
+def create_interpreter(engine: str = "tesseract", **kwargs) -> ImageInterpreter:
+    factory = _ENGINES.get(engine)
+    if factory is None:
+        raise ValueError(f"Unsupported engine: {engine} (available: {', '.join(available_engines())})")
+    return factory(**kwargs)
+
+
+def _is_bytes_ref(ref: ImageRef) -> bool:
+    return isinstance(ref, (bytes, bytearray, memoryview))
+
+
+def _ref_label(ref: ImageRef) -> str:
+    if _is_bytes_ref(ref):
+        return f"<{len(ref)} bytes>"
+    return str(ref)
+
+
+def _open_image(ref: ImageRef):
+    from PIL import Image
+    if _is_bytes_ref(ref):
+        return Image.open(io.BytesIO(ref))
+    return Image.open(ref)
+
+
+def _preprocess(img):
+    from PIL import ImageOps
+
+    # 预处理：灰度 + 自适应对比（对截图、流程图文字通常更稳）
+    img = ImageOps.grayscale(img)
+    img = ImageOps.autocontrast(img)
+
+    # 简单放大：小字/截图常见，放大可提升召回
+    w, h = img.size
+    if max(w, h) < 1600:
+        img = img.resize((w * 2, h * 2))
+    return img
+
+
+class _LoggingMixin:
+    _log_limit = 5
+
+    def _log_result(self, image: ImageRef, result: OcrResult) -> None:
+        logged = getattr(self, "_logged", 0)
+        if logged >= self._log_limit:
+            return
+
+        preview = (result.text or "").replace("\n", " ")
+        if len(preview) > 60:
+            preview = preview[:57] + "..."
+        status = "error" if result.error else "ok"
+        error_info = f" error={result.error}" if result.error else ""
+        print(f"[OCR] {status} {_ref_label(image)} ({result.method}){error_info}: {preview}")
+        self._logged = logged + 1
+
+
+@register_engine("tesseract")
+class OcrInterpreter(_LoggingMixin):
     def __init__(self, engine: str = "tesseract", lang: str = "chi_sim+eng"):
         self.engine = engine
         self.lang = lang
-        self._log_limit = 5
         self._logged = 0
+        # OCR 配置：psm 6（假设一块文本区域）
+        self.config = "--psm 6"
 
     def _check_tesseract(self) -> Optional[str]:
         if shutil.which("tesseract") is None:
             return "tesseract not found in PATH. Install it (e.g., brew install tesseract) or set PATH."
         return None
-    
 
-    def interpret(self, image_path: str) -> str:
-        # TODO: 接入 pytesseract / easyocr / 或调用你的视觉模型
-        # 先返回占位，确保管道跑通
-        return self.interpret_rich(image_path).text
+    def interpret(self, image: ImageRef) -> str:
+        return self.interpret_rich(image).text
 
+    def interpret_batch(self, images: Sequence[ImageRef]) -> List[str]:
+        return [r.text for r in self.interpret_batch_rich(images)]
 
-    def interpret_rich(self, image_path: str) -> OcrResult:
+    def interpret_rich(self, image: ImageRef) -> OcrResult:
         if self.engine != "tesseract":
-            result = OcrResult(text="", method=self.engine, error=f"Unsupported engine: {self.engine}")
-            self._log_result(image_path, result)
+            result = OcrResult(text="", method=self.engine,
+                               error=f"Unsupported engine: {self.engine}, use create_interpreter()")
+            self._log_result(image, result)
             return result
 
         err = self._check_tesseract()
         if err:
             result = OcrResult(text="", method="tesseract", error=err)
-            self._log_result(image_path, result)
+            self._log_result(image, result)
             return result
 
         try:
-            from PIL import Image, ImageOps
+            from PIL import Image  # noqa: F401
             import pytesseract
         except Exception as e:
             result = OcrResult(text="", method="tesseract", error=f"Missing deps: {e}")
-            self._log_result(image_path, result)
+            self._log_result(image, result)
             return result
 
         try:
-            img = Image.open(image_path)
-
-            # 预处理：灰度 + 自适应对比（对截图、流程图文字通常更稳）
-            img = ImageOps.grayscale(img)
-            img = ImageOps.autocontrast(img)
-
-            # 简单放大：小字/截图常见，放大可提升召回
-            w, h = img.size
-            if max(w, h) < 1600:
-                img = img.resize((w * 2, h * 2))
-
-            # OCR 配置：psm 6（假设一块文本区域）
-            config = "--psm 6"
-            text = pytesseract.image_to_string(img, lang=self.lang, config=config)
+            img = _preprocess(_open_image(image))
+            text = pytesseract.image_to_string(img, lang=self.lang, config=self.config)
             text = (text or "").strip()
 
             result = OcrResult(text=text, method="tesseract", error=None)
         except Exception as e:
             result = OcrResult(text="", method="tesseract", error=str(e))
 
-        self._log_result(image_path, result)
+        self._log_result(image, result)
         return result
 
-    def _log_result(self, image_path: str, result: OcrResult) -> None:
-        if self._logged >= self._log_limit:
-            return
+    def interpret_batch_rich(self, images: Sequence[ImageRef]) -> List[OcrResult]:
+        """
+        一次 tesseract 进程处理整批图片（文件列表输入，输出按换页符 \\f 分隔），
+        语言数据只加载一次。整批失败或页数对不上时逐张回退。
+        """
+        if len(images) <= 1 or self.engine != "tesseract" or self._check_tesseract():
+            return [self.interpret_rich(im) for im in images]
 
-        preview = (result.text or "").replace("\n", " ")
-        if len(preview) > 60:
-            preview = preview[:57] + "..."
-        status = "error" if result.error else "ok"
-        error_info = f" error={result.error}" if result.error else ""
-        print(f"[OCR] {status} {image_path} ({result.method}){error_info}: {preview}")
-        self._logged += 1
\ No newline at end of file
+        try:
+            with tempfile.TemporaryDirectory(prefix="ocr_batch_") as tmp:
+                listing = []
+                for k, im in enumerate(images):
+                    p = Path(tmp) / f"{k:05d}.png"
+                    _preprocess(_open_image(im)).save(p)
+                    listing.append(str(p))
+                list_file = Path(tmp) / "images.txt"
+                list_file.write_text("\n".join(listing) + "\n", encoding="utf-8")
+
+                cmd = ["tesseract", str(list_file), "stdout", "-l", self.lang] + self.config.split()
+                proc = subprocess.run(cmd, capture_output=True, check=True)
+            pages = proc.stdout.decode("utf-8", errors="replace").split("\f")
+        except Exception:
+            return [self.interpret_rich(im) for im in images]
+
+        # 末尾换页符后面是空串
+        if len(pages) == len(images) + 1 and not pages[-1].strip():
+            pages = pages[:-1]
+        if len(pages) != len(images):
+            return [self.interpret_rich(im) for im in images]
+
+        results = [OcrResult(text=t.strip(), method="tesseract", error=None) for t in pages]
+        for im, r in zip(images, results):
+            self._log_result(im, r)
+        return results
+
+
+@register_engine("rapidocr")
+class OnnxOcrInterpreter(_LoggingMixin):
+    """
+    ONNX 推理的 OCR（rapidocr_onnxruntime）。模型在第一次使用时加载一次，
+    之后整批图片共用同一个推理 session。
+    """
+
+    def __init__(self, lang: str = "chi_sim+eng", **engine_kwargs):
+        self.lang = lang  # 模型自带中英文，不需要语言包
+        self.engine_kwargs = engine_kwargs
+        self._engine = None
+        self._load_error: Optional[str] = None
+        self._logged = 0
+
+    def _get_engine(self):
+        if self._engine is None and self._load_error is None:
+            try:
+                from rapidocr_onnxruntime import RapidOCR
+                self._engine = RapidOCR(**self.engine_kwargs)
+            except Exception as e:
+                self._load_error = f"Missing deps: {e}"
+        return self._engine
+
+    def interpret(self, image: ImageRef) -> str:
+        return self.interpret_batch([image])[0]
+
+    def interpret_batch(self, images: Sequence[ImageRef]) -> List[str]:
+        return [r.text for r in self.interpret_batch_rich(images)]
+
+    def interpret_rich(self, image: ImageRef) -> OcrResult:
+        return self.interpret_batch_rich([image])[0]
+
+    def interpret_batch_rich(self, images: Sequence[ImageRef]) -> List[OcrResult]:
+        engine = self._get_engine()
+        out: List[OcrResult] = []
+        for im in images:
+            if engine is None:
+                result = OcrResult(text="", method="rapidocr", error=self._load_error)
+            else:
+                try:
+                    src = bytes(im) if _is_bytes_ref(im) else str(im)
+                    lines, _ = engine(src)
+                    text = "\n".join(line[1] for line in (lines or []))
+                    result = OcrResult(text=text.strip(), method="rapidocr", error=None)
+                except Exception as e:
+                    result = OcrResult(text="", method="rapidocr", error=str(e))
+            self._log_result(im, result)
+            out.append(result)
+        return out
+
+
+@register_engine("vision_stub")
+class VisionStubInterpreter:
+    """
+    本地视觉模型桩：不做真实识别，返回图片格式/尺寸描述。
+    用于在没有 OCR 依赖的环境里跑通管道、给 benchmark 提供基线。
+    """
+
+    def __init__(self, lang: str = "", **_):
+        self.lang = lang
+
+    def interpret(self, image: ImageRef) -> str:
+        return self.interpret_batch([image])[0]
+
+    def interpret_batch(self, images: Sequence[ImageRef]) -> List[str]:
+        out = []
+        for im in images:
+            try:
+                with _open_image(im) as img:
+                    out.append(f"[IMAGE {img.format} {img.size[0]}x{img.size[1]}]")
+            except Exception:
+                out.append("")
+        return out
+
+
+def interpreter_settings(interp) -> Dict[str, object]:
+    """影响识别结果的引擎设置（语言、tesseract 参数、模型参数），用作缓存命名空间的一部分。"""
+    out: Dict[str, object] = {"engine": engine_name(interp)}
+    for attr in ("lang", "config", "engine_kwargs"):
+        v = getattr(interp, attr, None)
+        if v not in (None, "", {}):
+            out[attr] = v
+    return out
+
+
+def engine_name(interp) -> str:
+    for name, factory in _ENGINES.items():
+        if type(interp) is factory:
+            return name
+    return type(interp).__name__
+
+
+class CachingInterpreter:
+    """
+    按图片内容摘要做磁盘缓存：cache_dir/{engine}-{设置摘要}/{hash_algo}-{digest}.txt。
+    命名空间包含 lang/config 等设置：换参数重跑同一个作业目录时不会读到旧结果。
+    多个进程共享同一个目录（写临时文件再 rename，读写都不加锁），
+    同一张图在一个归档的多个 HTML part 里出现时只识别一次。
+    digests: payload_path -> (hash_algo, digest)，即 PartRecord 的 hash_algo/sha256，避免重新读文件算哈希；
+    缺失时现算 sha256。摘要总是带着算法名，不同 hash_algo 的结果不会混用。
+    """
+
+    def __init__(self, inner: ImageInterpreter, cache_dir: Union[str, Path],
+                 digests: Optional[Dict[str, Tuple[str, str]]] = None):
+        self.inner = inner
+        settings = interpreter_settings(inner)
+        raw = json.dumps(settings, ensure_ascii=False, sort_keys=True, default=str)
+        self.dir = Path(cache_dir) / f"{settings['engine']}-{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:12]}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        settings_file = self.dir / "settings.json"
+        if not settings_file.exists():
+            self._write_atomic(settings_file, raw)
+        self.digests = dict(digests or {})
+
+    def _key(self, image: ImageRef) -> str:
+        if _is_bytes_ref(image):
+            return f"sha256-{hashlib.sha256(image).hexdigest()}"
+        entry = self.digests.get(str(image))
+        if entry is None:
+            with open(image, "rb") as f:
+                digest = hashlib.file_digest(f, "sha256").hexdigest() if hasattr(hashlib, "file_digest") \
+                    else hashlib.sha256(f.read()).hexdigest()
+            entry = self.digests[str(image)] = ("sha256", digest)
+        algo, digest = entry
+        return f"{algo}-{digest}"
+
+    @staticmethod
+    def _write_atomic(target: Path, text: str) -> None:
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, target)
+
+    def _get(self, key: str) -> Optional[str]:
+        try:
+            return (self.dir / f"{key}.txt").read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+
+    def _put(self, key: str, text: str) -> None:
+        self._write_atomic(self.dir / f"{key}.txt", text)
+
+    def interpret(self, image: ImageRef) -> str:
+        return self.interpret_batch([image])[0]
+
+    def interpret_batch(self, images: Sequence[ImageRef]) -> List[str]:
+        keys = [self._key(im) for im in images]
+        out: List[Optional[str]] = [self._get(k) for k in keys]
+
+        # 只把未命中的交给底层引擎，同一批里重复的图也只送一次
+        pending: Dict[str, int] = {}
+        for k, (key, text) in enumerate(zip(keys, out)):
+            if text is None and key not in pending:
+                pending[key] = k
+        if pending:
+            texts = self.inner.interpret_batch([images[k] for k in pending.values()])
+            fresh = dict(zip(pending, texts))
+            for key, text in fresh.items():
+                # 空结果不落盘：可能是引擎缺依赖/出错，下次换好环境还能重试
+                if text:
+                    self._put(key, text)
+            out = [fresh[key] if text is None else text for key, text in zip(keys, out)]
+        return [t or "" for t in out]
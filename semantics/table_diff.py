@@ -0,0 +1,212 @@
+# semantics/table_diff.py
+# 同一份需求规格的新旧版本对比：先把新旧 TableBlock 配对，再按行哈希做序列对齐，
+# 输出新增/删除/变更的行，只有 delta 需要再去做 OCR 复核和用例生成。
+import difflib
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from model.mht_model import TableBlock
+from case_gen.row_packer import make_row_payload
+
+# 按内容配对时，行哈希集合的 Jaccard 相似度低于该值视为不是同一张表
+MIN_CONTENT_SIMILARITY = 0.3
+
+
+def row_hash(schema: List[str], row: Dict[str, str]) -> str:
+    # 只哈希值（按 schema 顺序），列名改动不影响行是否相同的判定
+    values = [(row.get(c) or "").strip() for c in schema]
+    raw = json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _anchor(t: TableBlock) -> Optional[str]:
+    return (t.meta or {}).get("anchor")
+
+
+def _table_id(t: TableBlock) -> str:
+    # 旧作业没有 meta.table_id（单 HTML part），退回 T{order}
+    return (t.meta or {}).get("table_id") or f"T{t.order}"
+
+
+def _match_key(t: TableBlock) -> Tuple[Optional[str], Optional[str], Tuple[str, ...]]:
+    # 多 sheet 导出里不同 sheet 的同名表格不能互配；part 序号可能随版本变化，用 sheet 名
+    return (t.meta or {}).get("sheet"), _anchor(t), tuple(t.schema)
+
+
+def _row_hashes(t: TableBlock) -> List[str]:
+    return [row_hash(t.schema, r) for r in t.rows]
+
+
+def load_tables_json(path: str) -> List[TableBlock]:
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return [TableBlock(**d) for d in data]
+
+
+def load_job_tables(job_dir: str) -> List[TableBlock]:
+    """读取某个作业全量抽取的 semantics/tables.json（带 query 的运行写在 semantics/query/ 下，不影响它）。"""
+    return load_tables_json(str(Path(job_dir) / "semantics" / "tables.json"))
+
+
+def match_tables(old: List[TableBlock], new: List[TableBlock]
+                 ) -> Tuple[List[Tuple[int, int, str, float]], List[int], List[int]]:
+    """
+    返回 (pairs, removed_old_idx, added_new_idx)；pairs 元素为 (old_idx, new_idx, match_kind, similarity)。
+    配对顺序：
+      1) sheet + anchor + schema 完全一致（同 key 多张时按出现顺序一一对应）
+      2) 剩余表格按行哈希集合 Jaccard 相似度贪心配对（倒排索引只比较有共同行的候选）
+    """
+    old_hashes = [set(_row_hashes(t)) for t in old]
+    new_hashes = [set(_row_hashes(t)) for t in new]
+
+    pairs: List[Tuple[int, int, str, float]] = []
+    used_old, used_new = set(), set()
+
+    by_key: Dict[Tuple[Optional[str], Optional[str], Tuple[str, ...]], List[int]] = {}
+    for i, t in enumerate(old):
+        by_key.setdefault(_match_key(t), []).append(i)
+    for j, t in enumerate(new):
+        bucket = by_key.get(_match_key(t))
+        if bucket:
+            i = bucket.pop(0)
+            pairs.append((i, j, "anchor_schema", _jaccard(old_hashes[i], new_hashes[j])))
+            used_old.add(i)
+            used_new.add(j)
+
+    inverted: Dict[str, List[int]] = {}
+    for i, hs in enumerate(old_hashes):
+        if i in used_old:
+            continue
+        for h in hs:
+            inverted.setdefault(h, []).append(i)
+
+    scored: List[Tuple[float, int, int]] = []
+    for j, hs in enumerate(new_hashes):
+        if j in used_new:
+            continue
+        candidates = {i for h in hs for i in inverted.get(h, ())}
+        for i in candidates:
+            sim = _jaccard(old_hashes[i], hs)
+            if sim >= MIN_CONTENT_SIMILARITY:
+                scored.append((sim, i, j))
+
+    for sim, i, j in sorted(scored, key=lambda x: (-x[0], x[1], x[2])):
+        if i in used_old or j in used_new:
+            continue
+        pairs.append((i, j, "content", sim))
+        used_old.add(i)
+        used_new.add(j)
+
+    removed = [i for i in range(len(old)) if i not in used_old]
+    added = [j for j in range(len(new)) if j not in used_new]
+    return sorted(pairs, key=lambda p: p[1]), removed, added
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def align_rows(old: TableBlock, new: TableBlock, force_reason: Optional[str] = None) -> Dict[str, Any]:
+    """
+    行哈希序列上做 LCS 风格对齐（difflib，关闭 autojunk 以免高频行被当噪声）。
+    replace 区间按位置两两配成 changed，多出来的算 added / removed。
+    force_reason: 表头或 anchor 变了时传 "schema"/"anchor"——行哈希只看值，值没变的行也要算 changed，
+    因为 prompt 和用例缓存键都包含表头和 anchor，旧用例已经过期。
+    """
+    a, b = _row_hashes(old), _row_hashes(new)
+    sm = difflib.SequenceMatcher(None, a, b, autojunk=False)
+
+    added: List[int] = []
+    removed: List[int] = []
+    changed: List[Dict[str, Any]] = []
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            if force_reason:
+                changed.extend({"old": i1 + k, "new": j1 + k, "columns": [], "reason": force_reason}
+                               for k in range(i2 - i1))
+            continue
+        if tag == "insert":
+            added.extend(range(j1, j2))
+        elif tag == "delete":
+            removed.extend(range(i1, i2))
+        else:  # replace
+            n = min(i2 - i1, j2 - j1)
+            for k in range(n):
+                oi, nj = i1 + k, j1 + k
+                changed.append({"old": oi, "new": nj,
+                                "columns": _changed_columns(old.schema, old.rows[oi], new.schema, new.rows[nj]),
+                                "reason": force_reason or "content"})
+            removed.extend(range(i1 + n, i2))
+            added.extend(range(j1 + n, j2))
+
+    changed.sort(key=lambda c: c["new"])
+    return {"added_rows": added, "removed_rows": removed, "changed_rows": changed}
+
+
+def _changed_columns(old_schema: List[str], old_row: Dict[str, str],
+                     new_schema: List[str], new_row: Dict[str, str]) -> List[str]:
+    cols = []
+    for k, col in enumerate(new_schema):
+        old_col = col if col in old_row else (old_schema[k] if k < len(old_schema) else None)
+        old_v = (old_row.get(old_col) or "").strip() if old_col is not None else ""
+        if (new_row.get(col) or "").strip() != old_v:
+            cols.append(col)
+    return cols
+
+
+def diff_tables(old: List[TableBlock], new: List[TableBlock]) -> Dict[str, Any]:
+    pairs, removed, added = match_tables(old, new)
+
+    tables: List[Dict[str, Any]] = []
+    summary = {"tables_unchanged": 0, "tables_changed": 0, "tables_added": len(added), "tables_removed": len(removed),
+               "rows_added": 0, "rows_removed": 0, "rows_changed": 0}
+
+    for i, j, kind, sim in pairs:
+        if old[i].schema != new[j].schema:
+            reason = "schema"
+        elif _anchor(old[i]) != _anchor(new[j]):
+            reason = "anchor"
+        else:
+            reason = None
+        rows = align_rows(old[i], new[j], force_reason=reason)
+        changed = bool(rows["added_rows"] or rows["removed_rows"] or rows["changed_rows"]) or reason is not None
+        summary["tables_changed" if changed else "tables_unchanged"] += 1
+        summary["rows_added"] += len(rows["added_rows"])
+        summary["rows_removed"] += len(rows["removed_rows"])
+        summary["rows_changed"] += len(rows["changed_rows"])
+        tables.append({"status": "changed" if changed else "unchanged",
+                       "old_table_id": _table_id(old[i]), "new_table_id": _table_id(new[j]),
+                       "anchor": _anchor(new[j]), "match": kind, "similarity": round(sim, 4), **rows})
+
+    for j in added:
+        summary["rows_added"] += len(new[j].rows)
+        tables.append({"status": "added", "old_table_id": None, "new_table_id": _table_id(new[j]), "anchor": _anchor(new[j]),
+                       "added_rows": list(range(len(new[j].rows))), "removed_rows": [], "changed_rows": []})
+    for i in removed:
+        summary["rows_removed"] += len(old[i].rows)
+        tables.append({"status": "removed", "old_table_id": _table_id(old[i]), "new_table_id": None, "anchor": _anchor(old[i]),
+                       "added_rows": [], "removed_rows": list(range(len(old[i].rows))), "changed_rows": []})
+
+    return {"summary": summary, "tables": tables}
+
+
+def iter_delta_row_payloads(new: List[TableBlock], diff: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """只产出新版本中新增/变更行的 payload（格式同 row_packer），交给用例生成。"""
+    by_id = {_table_id(t): t for t in new}
+    for entry in diff["tables"]:
+        if entry["new_table_id"] is None:
+            continue
+        table = by_id[entry["new_table_id"]]
+        added = set(entry["added_rows"])
+        reasons = {c["new"]: c.get("reason", "content") for c in entry["changed_rows"]}
+        for r_idx in sorted(added | set(reasons)):
+            payload = make_row_payload(table, table_index=table.order, row_index=r_idx)
+            if r_idx in added:
+                payload["delta"] = "added"
+            else:
+                payload["delta"] = "changed"
+                payload["delta_reason"] = reasons[r_idx]
+            yield payload
@@ -1,14 +1,15 @@
 from dataclasses import dataclass
 import re
-from typing import List, Optional, Protocol, Dict,Any
+from typing import Iterator, List, Optional, Dict, Any, Sequence, Tuple
 from bs4 import Tag, NavigableString
 
 from mht_parser.part_index import PartIndex
 from model.mht_model import PartRecord, TableBlock
-class ImageInterpreter(Protocol):
-    def interpret(self, image_path: str) -> str:
-        ...
-    
+from semantics.image_semantics import ImageInterpreter, ImageRef
+
+# 批量 OCR 每批最多张数
+OCR_BATCH_SIZE = 32
+
 # @dataclass
 # class TableBlock:
 #     kind: str 
@@ -118,68 +119,175 @@ def _cell_text_with_assets(td: Tag,
 
     return "\n".join([p for p in parts if p]).strip()
 
-def _normalize_table_to_grid(table: Tag,
-                             part_index,
-                             image_interpreter) -> List[List[Tag]]:
-    trs = table.find_all("tr")
-    grid: List[List[Tag]] = []
-    spans: List[Optional[Dict[str, Any]]] = []
+# span 上限（同 HTML 规范）：畸形属性如 colspan="5000" 直接截断，避免撑爆内存
+MAX_COLSPAN = 1000
+MAX_ROWSPAN = 65534
+# 单行最多展开的列数
+MAX_COLS = 1000
+_RE_SPAN = re.compile(r"^\s*(\d+)")
 
-    for tr in trs:
-        row: List[Tag] = []
+def _parse_span(value, upper: int, zero_means_upper: bool = False) -> int:
+    """
+    rowspan/colspan 容错解析：取前导数字，非法或 <1 按 1，超上限截断。
+    zero_means_upper 只给 rowspan 用：HTML 里 rowspan=0 表示延续到表尾，colspan=0 是非法值按 1。
+    """
+    m = _RE_SPAN.match(str(value)) if value is not None else None
+    if not m:
+        return 1
+    n = int(m.group(1))
+    if n == 0:
+        return upper if zero_means_upper else 1
+    return min(n, upper)
+
+def _iter_own_rows(table: Tag) -> Iterator[Tag]:
+    # 只取本表的 tr（含 thead/tbody/tfoot 下的），不下钻到嵌套表格
+    for child in table.children:
+        if not isinstance(child, Tag):
+            continue
+        if child.name == "tr":
+            yield child
+        elif child.name in ("thead", "tbody", "tfoot"):
+            for tr in child.children:
+                if isinstance(tr, Tag) and tr.name == "tr":
+                    yield tr
+
+def iter_table_rows(table: Tag,
+                    part_index: PartIndex,
+                    image_interpreter: Optional[ImageInterpreter],
+                    max_colspan: int = MAX_COLSPAN,
+                    max_rowspan: int = MAX_ROWSPAN,
+                    max_cols: int = MAX_COLS) -> Iterator[List[str]]:
+    """
+    逐行产出展开 rowspan/colspan 后的行（去掉末尾空列，不做全表对齐）。
+    仍在生效的 rowspan 用 {col: [remain, value]} 稀疏记录，内存只与当前行宽有关。
+    """
+    active: Dict[int, List[Any]] = {}
+
+    for tr in _iter_own_rows(table):
+        row: Dict[int, str] = {}
+
+        # 上方 rowspan 延续下来的值先占位
+        for c in list(active):
+            sp = active[c]
+            row[c] = sp[1]
+            sp[0] -= 1
+            if sp[0] <= 0:
+                del active[c]
 
         col = 0
-        while col < len(spans):
-            sp = spans[col]
-            if sp and sp["remain"] > 0:
-                row.append(sp["value"])
-                sp["remain"] -= 1
-            else:
-                row.append("")
-            col += 1
-        
-        cells = tr.find_all(["td","th"])
-        col = 0
-        for cell in cells:
-            if cell is None or not isinstance(cell, Tag):
-                continue
+        for cell in tr.find_all(["td", "th"], recursive=False):
             #找下一个空位（跳过 rowspan 已占用的列）
-            while col < len(row) and row[col] != "":
+            while col in row:
                 col += 1
-            if col >= len(row):
-                extend = col - len(row) + 1
-                row.extend([""] * extend)
-                spans.extend([None] * extend)
+            if col >= max_cols:
+                break
 
             value = _cell_text_with_assets(cell, part_index, image_interpreter)
-            attrs = cell.attrs or {}
-            rowspan = int(attrs.get("rowspan") or 1)
-            colspan = int(attrs.get("colspan") or 1)
-
-            for k in range(colspan):
-                idx = col + k
-                if idx >= len(row):
-                    row.extend([""] * (idx - len(row) + 1))
-                    spans.extend([None] * (idx - len(spans) + 1))
+            rowspan = _parse_span(cell.get("rowspan"), max_rowspan, zero_means_upper=True)
+            colspan = _parse_span(cell.get("colspan"), max_colspan)
+
+            for idx in range(col, min(col + colspan, max_cols)):
                 row[idx] = value
                 if rowspan > 1:
-                    spans[idx] = {"remain": rowspan - 1, "value": value}
+                    active[idx] = [rowspan - 1, value]
+                else:
+                    active.pop(idx, None)
 
             col += colspan
 
+        values = [row.get(i, "") for i in range(max(row) + 1)] if row else []
         # 去掉末尾多余空列
-        while row and row[-1] == "":
-            row.pop()
+        while values and values[-1] == "":
+            values.pop()
+        yield values
 
-        grid.append(row)
-    
-    # 全表对齐列数
-    max_cols = max((len(r) for r in grid), default=0)
-    for r in grid:
-        if len(r) < max_cols:
-            r.extend([""] * (max_cols - len(r)))
+def peek_table_schema(table: Tag) -> List[str]:
+    """只读首行文本当表头（不做 OCR、不改 DOM），供抽取前的快速过滤。"""
+    first = next(_iter_own_rows(table), None)
+    if first is None:
+        return []
+    return [_RE_WS.sub(" ", c.get_text(" ", strip=True)) for c in first.find_all(["td", "th"], recursive=False)]
+
+class _PrefetchedInterpreter:
+    """整张表的图片先批量解释好，单元格抽取时按路径取结果；没预取到的再走原解释器。"""
 
-    return grid
+    def __init__(self, inner: ImageInterpreter, texts: Dict[str, str]):
+        self.inner = inner
+        self.texts = texts
+
+    def interpret(self, image: ImageRef) -> str:
+        if isinstance(image, str) and image in self.texts:
+            return self.texts[image]
+        return self.inner.interpret(image)
+
+    def interpret_batch(self, images: Sequence[ImageRef]) -> List[str]:
+        return [self.interpret(im) for im in images]
+
+def _prefetch_table_images(table: Tag,
+                           part_index: PartIndex,
+                           image_interpreter: Optional[ImageInterpreter]) -> Optional[ImageInterpreter]:
+    batch = getattr(image_interpreter, "interpret_batch", None)
+    if image_interpreter is None or batch is None:
+        return image_interpreter
+
+    paths: List[str] = []
+    seen = set()
+    for img in table.find_all("img"):
+        # 子表里的图片不会进入单元格文本（子表转 markdown 只取文字），不做 OCR
+        if img.find_parent("table") is not table:
+            continue
+        src = (img.get("src") or "").strip()
+        pr = part_index.resolve_img(src) if src else None
+        if pr and pr.payload_path and pr.payload_path not in seen:
+            seen.add(pr.payload_path)
+            paths.append(pr.payload_path)
+    if not paths:
+        return image_interpreter
+
+    texts: Dict[str, str] = {}
+    for i in range(0, len(paths), OCR_BATCH_SIZE):
+        chunk = paths[i:i + OCR_BATCH_SIZE]
+        texts.update(zip(chunk, batch(chunk)))
+    return _PrefetchedInterpreter(image_interpreter, texts)
+
+def _extra_column_name(schema: List[str], k: int) -> str:
+    # 比表头宽的列（表头末尾空单元格被裁掉、或数据行多出单元格）用合成列名，保证不和已有列重名
+    name = f"col_{k + 1}"
+    while name in schema:
+        name += "_"
+    return name
+
+def stream_table(table: Tag,
+                 part_index: PartIndex,
+                 image_interpreter: Optional[ImageInterpreter]) -> Tuple[List[str], Iterator[Dict[str, str]]]:
+    """
+    首行作为 schema，其余行以迭代器形式逐行产出 dict（空行跳过，短行补空）。
+    遇到比 schema 宽的行时就地给 schema 追加合成列名（col_N），多出的单元格不丢；
+    因此 schema 列表在迭代结束后才是最终列集，之前产出的行可能缺少后加的列。
+    供 JSONL 写出、row_packer 等下游流式消费，不在内存里攒整张表。
+    """
+    image_interpreter = _prefetch_table_images(table, part_index, image_interpreter)
+    rows_iter = iter_table_rows(table, part_index, image_interpreter)
+    first = next(rows_iter, None)
+    if first is None:
+        return [], iter(())
+
+    schema = [x.strip() for x in first]
+
+    def _rows() -> Iterator[Dict[str, str]]:
+        for r in rows_iter:
+            if not any((c or "").strip() for c in r):
+                continue
+            values = [c.strip() for c in r]
+
+            while len(schema) < len(values):
+                schema.append(_extra_column_name(schema, len(schema)))
+            if len(values) < len(schema):
+                values.extend([""] * (len(schema) - len(values)))
+
+            yield dict(zip(schema, values))
+
+    return schema, _rows()
 
 
 def _cell_text_with_images(
@@ -210,25 +318,15 @@ def extract_table_blocks(table: Tag,
                          part_index: PartIndex,
                          image_interpreter) -> TableBlock:
     
-    grid = _normalize_table_to_grid(table, part_index, image_interpreter)
-    if not grid:
+    schema, rows_iter = stream_table(table, part_index, image_interpreter)
+    if not schema:
         return TableBlock(kind="table", order=order, schema=[], rows=[], meta=None)
-    
-    schema = [x.strip() for x in grid[0]]
-    rows: List[Dict[str, str]] = []
-
-    for r in grid[1:]:
-        if not any((c or "").strip() for c in r):
-            continue
-        values = [c.strip() for c in r]
-
-        if len(values) < len(schema):
-            values.extend([""] * (len(schema) - len(values)))
-        elif len(values) > len(schema):
-            values = values[:len(schema)]
-
-        rows.append(dict(zip(schema, values)))
 
+    rows = list(rows_iter)
+    # 流式过程中 schema 可能被加宽：先产出的行补齐后加的列
+    for r in rows:
+        for col in schema[len(r):]:
+            r.setdefault(col, "")
     return TableBlock(kind="table", order=order, schema=schema, rows=rows, meta=None)
 
     # 简单按首行作为表头处理
@@ -0,0 +1,142 @@
+# service/job_queue.py
+# 磁盘上的作业队列：目录布局沿用 ideal.txt 的 jobs/{job_id}/...
+#   jobs/{job_id}/job.json        状态记录（服务重启后据此恢复）
+#   jobs/{job_id}/input/xxx.mht   原始上传
+#   jobs/{job_id}/structure/ semantics/ outputs/   由 run_pipeline 写入
+import json
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, asdict, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINAL_STATES = (DONE, FAILED, CANCELLED)
+
+
+@dataclass
+class JobRecord:
+    job_id: str
+    status: str
+    input_name: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+    error: Optional[str] = None
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+def _safe_name(name: str) -> str:
+    name = Path(name or "").name.strip().strip('"')
+    name = re.sub(r"[\\/:*?\"<>|]", "_", name)
+    return name[:180] or "upload.mht"
+
+
+class JobQueue:
+    """
+    只负责作业目录和状态持久化；真正的调度交给 WarmWorkerPool。
+    所有状态变更都在锁内完成并立即写回 job.json。
+    """
+
+    def __init__(self, jobs_root: str):
+        self.root = Path(jobs_root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, JobRecord] = {}
+        self._load_existing()
+
+    def _load_existing(self) -> None:
+        for meta in self.root.glob("*/job.json"):
+            try:
+                rec = JobRecord(**json.loads(meta.read_text(encoding="utf-8")))
+            except Exception:
+                continue
+            # 上次进程退出时还在跑的作业：已请求取消的直接记为取消，其余重新排队
+            if rec.status == RUNNING:
+                if rec.cancel_requested:
+                    rec.status = CANCELLED
+                    rec.finished_at = time.time()
+                else:
+                    rec.status = QUEUED
+                    rec.started_at = None
+                self._save(rec)
+            self._jobs[rec.job_id] = rec
+
+    def job_dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def input_path(self, job_id: str) -> Path:
+        rec = self._jobs[job_id]
+        return self.job_dir(job_id) / "input" / rec.input_name
+
+    def _save(self, rec: JobRecord) -> None:
+        path = self.job_dir(rec.job_id) / "job.json"
+        tmp = path.with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(asdict(rec), ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(path)
+
+    def create(self, filename: str, data: bytes) -> JobRecord:
+        job_id = uuid.uuid4().hex[:16]
+        rec = JobRecord(job_id=job_id, status=QUEUED, input_name=_safe_name(filename), created_at=time.time())
+        in_dir = self.job_dir(job_id) / "input"
+        in_dir.mkdir(parents=True, exist_ok=True)
+        (in_dir / rec.input_name).write_bytes(data)
+        with self._lock:
+            self._jobs[job_id] = rec
+            self._save(rec)
+        return rec
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pending(self) -> List[JobRecord]:
+        with self._lock:
+            return sorted((r for r in self._jobs.values() if r.status == QUEUED), key=lambda r: r.created_at)
+
+    def mark_running(self, job_id: str) -> bool:
+        with self._lock:
+            rec = self._jobs[job_id]
+            if rec.status != QUEUED or rec.cancel_requested:
+                return False
+            rec.status = RUNNING
+            rec.started_at = time.time()
+            self._save(rec)
+            return True
+
+    def mark_finished(self, job_id: str, error: Optional[str] = None,
+                      timings_ms: Optional[Dict[str, float]] = None) -> JobRecord:
+        with self._lock:
+            rec = self._jobs[job_id]
+            if rec.cancel_requested:
+                # 运行中被取消：结果保留在目录里，但状态以取消为准
+                rec.status = CANCELLED
+            else:
+                rec.status = FAILED if error else DONE
+            rec.error = error
+            rec.finished_at = time.time()
+            rec.timings_ms.update(timings_ms or {})
+            # 端到端延迟：从上传入队到完成
+            rec.timings_ms["latency_ms"] = (rec.finished_at - rec.created_at) * 1000
+            self._save(rec)
+            return rec
+
+    def request_cancel(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            rec = self._jobs.get(job_id)
+            if rec is None or rec.status in FINAL_STATES:
+                return rec
+            rec.cancel_requested = True
+            if rec.status == QUEUED:
+                rec.status = CANCELLED
+                rec.finished_at = time.time()
+            self._save(rec)
+            return rec
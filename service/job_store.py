@@ -0,0 +1,260 @@
+# service/job_store.py
+# 多节点共享的作业表：作业目录仍是 jobs/{job_id}/input|structure|semantics|outputs（放在共享存储上），
+# 状态、租约和阶段 checkpoint 放在一个 SQLite 库里。
+#
+# 租约：节点 claim 作业时拿到 lease_expires_at，之后定期 heartbeat 续期；
+#      节点崩溃不再续期，租约过期后作业被其它节点回收（reclaim）重新排队，
+#      已记录的阶段 checkpoint 保留，新节点从最后完成的阶段之后续跑。
+# 所有写操作都带 lease_owner 条件（fencing）：租约已被回收的旧节点，写不进 checkpoint 和完成状态；
+# 作业目录里的阶段产物由 node_worker 在写盘前用 heartbeat 做同样的检查（见 run_pipeline 的 fence）。
+#
+# SQL 只用 SQLite 和 Postgres 都支持的子集（CASE、COALESCE、ON CONFLICT），换 Postgres 时把占位符换成 %s、
+# BEGIN IMMEDIATE 换成普通事务、claim 的 SELECT 加 FOR UPDATE SKIP LOCKED 即可；这里只实现 SQLite。
+# 共享存储（NFS/SMB）上不要用 WAL：WAL 依赖共享内存，跨主机不可靠，所以用默认的 rollback journal。
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from service.job_queue import CANCELLED, DONE, FAILED, QUEUED, RUNNING, _safe_name
+
+# 同一个作业被回收的次数上限：反复把节点搞崩的输入不能无限重试
+DEFAULT_MAX_ATTEMPTS = 3
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    " job_id TEXT PRIMARY KEY,"
+    " status TEXT NOT NULL,"
+    " input_name TEXT NOT NULL,"
+    " created_at REAL NOT NULL,"
+    " attempts INTEGER NOT NULL DEFAULT 0,"
+    " max_attempts INTEGER NOT NULL,"
+    " lease_owner TEXT,"
+    " lease_expires_at REAL,"
+    " heartbeat_at REAL,"
+    " started_at REAL,"
+    " finished_at REAL,"
+    " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+    " error TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)",
+    "CREATE TABLE IF NOT EXISTS checkpoints ("
+    " job_id TEXT NOT NULL,"
+    " stage TEXT NOT NULL,"
+    " node_id TEXT NOT NULL,"
+    " duration_ms REAL,"
+    " completed_at REAL NOT NULL,"
+    " PRIMARY KEY (job_id, stage))",
+)
+
+_JOB_COLUMNS = ("job_id", "status", "input_name", "created_at", "attempts", "max_attempts", "lease_owner",
+                "lease_expires_at", "heartbeat_at", "started_at", "finished_at", "cancel_requested", "error")
+
+
+class LeaseLost(RuntimeError):
+    """租约已过期被回收（或作业被取消），当前节点必须放弃这个作业。"""
+
+
+@dataclass
+class StoredJob:
+    job_id: str
+    status: str
+    input_name: str
+    created_at: float
+    attempts: int
+    max_attempts: int
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[float] = None
+    heartbeat_at: Optional[float] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    cancel_requested: bool = False
+    error: Optional[str] = None
+    completed_stages: List[str] = field(default_factory=list)
+
+
+class SqliteJobStore:
+    """
+    db_path: 共享存储上的 SQLite 文件；jobs_root: 同一共享存储上的作业目录根。
+    每个节点各自打开一个实例；同一实例可被 worker 线程和心跳线程共用。
+    """
+
+    def __init__(self, db_path: str, jobs_root: str, busy_timeout_s: float = 30.0):
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.root = Path(jobs_root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # isolation_level=None：自己控制事务，claim/reclaim 用 BEGIN IMMEDIATE 先拿写锁再读
+        self._conn = sqlite3.connect(db_path, timeout=busy_timeout_s, isolation_level=None,
+                                     check_same_thread=False)
+        with self._lock:
+            for stmt in _SCHEMA:
+                self._conn.execute(stmt)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # ---------------- 作业目录 ----------------
+    def job_dir(self, job_id: str) -> Path:
+        return self.root / job_id
+
+    def input_path(self, job: StoredJob) -> Path:
+        return self.job_dir(job.job_id) / "input" / job.input_name
+
+    # ---------------- 提交 / 查询 ----------------
+    def submit(self, filename: str, data: bytes, max_attempts: int = DEFAULT_MAX_ATTEMPTS) -> StoredJob:
+        job_id = uuid.uuid4().hex[:16]
+        input_name = _safe_name(filename)
+        in_dir = self.job_dir(job_id) / "input"
+        in_dir.mkdir(parents=True, exist_ok=True)
+        # 先落盘输入再插行：节点能 claim 到的作业，输入一定已经在共享存储上
+        (in_dir / input_name).write_bytes(data)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, status, input_name, created_at, max_attempts) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, input_name, time.time(), max_attempts),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[StoredJob]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE job_id = ?",
+                                     (job_id,)).fetchone()
+            if row is None:
+                return None
+            return self._to_job(row)
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def completed_stages(self, job_id: str) -> List[str]:
+        with self._lock:
+            return self._stages(job_id)
+
+    def _stages(self, job_id: str) -> List[str]:
+        rows = self._conn.execute("SELECT stage FROM checkpoints WHERE job_id = ? ORDER BY completed_at",
+                                  (job_id,)).fetchall()
+        return [r[0] for r in rows]
+
+    def _to_job(self, row) -> StoredJob:
+        d = dict(zip(_JOB_COLUMNS, row))
+        d["cancel_requested"] = bool(d["cancel_requested"])
+        return StoredJob(**d, completed_stages=self._stages(d["job_id"]))
+
+    # ---------------- 租约 ----------------
+    def _reclaim_expired_locked(self, now: float) -> int:
+        # 调用方已在 BEGIN IMMEDIATE 事务里
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = CASE WHEN cancel_requested = 1 THEN ?"
+            " WHEN attempts >= max_attempts THEN ? ELSE ? END,"
+            " error = CASE WHEN cancel_requested = 0 AND attempts >= max_attempts"
+            " THEN 'lease expired after ' || attempts || ' attempts' ELSE error END,"
+            " finished_at = CASE WHEN cancel_requested = 1 OR attempts >= max_attempts THEN ? ELSE NULL END,"
+            " lease_owner = NULL, lease_expires_at = NULL"
+            " WHERE status = ? AND lease_expires_at < ?",
+            (CANCELLED, FAILED, QUEUED, now, RUNNING, now),
+        )
+        return cur.rowcount
+
+    def reclaim_expired(self) -> int:
+        """把租约过期的 running 作业放回队列（超过重试次数的记为 failed），返回回收数。"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                n = self._reclaim_expired_locked(time.time())
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return n
+
+    def claim(self, node_id: str, lease_seconds: float) -> Optional[StoredJob]:
+        """回收过期租约后，领取最早的 queued 作业；没有可领的返回 None。"""
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._reclaim_expired_locked(now)
+                row = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                job_id = row[0]
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ?, heartbeat_at = ?,"
+                    " attempts = attempts + 1, started_at = COALESCE(started_at, ?)"
+                    " WHERE job_id = ? AND status = ?",
+                    (RUNNING, node_id, now + lease_seconds, now, now, job_id, QUEUED),
+                )
+                job_row = self._conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM jobs WHERE job_id = ?",
+                                             (job_id,)).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            return self._to_job(job_row)
+
+    def heartbeat(self, job_id: str, node_id: str, lease_seconds: float) -> None:
+        """续租；租约已不属于本节点或作业被取消时抛 LeaseLost。"""
+        with self._lock:
+            now = time.time()
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ?, heartbeat_at = ?"
+                " WHERE job_id = ? AND lease_owner = ? AND status = ? AND cancel_requested = 0",
+                (now + lease_seconds, now, job_id, node_id, RUNNING),
+            )
+            if cur.rowcount != 1:
+                raise LeaseLost(f"job {job_id}: lease no longer held by {node_id}")
+
+    def record_checkpoint(self, job_id: str, node_id: str, stage: str, duration_ms: float) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                owned = self._conn.execute(
+                    "SELECT 1 FROM jobs WHERE job_id = ? AND lease_owner = ? AND status = ?",
+                    (job_id, node_id, RUNNING),
+                ).fetchone()
+                if owned is None:
+                    raise LeaseLost(f"job {job_id}: lease lost before checkpoint {stage!r}")
+                self._conn.execute(
+                    "INSERT INTO checkpoints (job_id, stage, node_id, duration_ms, completed_at)"
+                    " VALUES (?, ?, ?, ?, ?)"
+                    " ON CONFLICT (job_id, stage) DO UPDATE SET node_id = excluded.node_id,"
+                    " duration_ms = excluded.duration_ms, completed_at = excluded.completed_at",
+                    (job_id, stage, node_id, duration_ms, time.time()),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def complete(self, job_id: str, node_id: str, error: Optional[str] = None) -> bool:
+        """结束作业并释放租约；租约已丢失时返回 False（结果以接手的节点为准）。"""
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = CASE WHEN cancel_requested = 1 THEN ? WHEN ? IS NULL THEN ? ELSE ? END,"
+                " error = ?, finished_at = ?, lease_owner = NULL, lease_expires_at = NULL"
+                " WHERE job_id = ? AND lease_owner = ? AND status = ?",
+                (CANCELLED, error, DONE, FAILED, error, time.time(), job_id, node_id, RUNNING),
+            )
+            return cur.rowcount == 1
+
+    def request_cancel(self, job_id: str) -> Optional[StoredJob]:
+        # queued 直接取消；running 置标记，持有节点在下一次心跳时放弃
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1,"
+                " status = CASE WHEN status = ? THEN ? ELSE status END,"
+                " finished_at = CASE WHEN status = ? THEN ? ELSE finished_at END"
+                " WHERE job_id = ? AND status IN (?, ?)",
+                (QUEUED, CANCELLED, QUEUED, time.time(), job_id, QUEUED, RUNNING),
+            )
+        return self.get(job_id)
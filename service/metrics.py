@@ -0,0 +1,41 @@
+# service/metrics.py
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+def _percentile(sorted_vals, q: float) -> Optional[float]:
+    if not sorted_vals:
+        return None
+    # nearest-rank：样本少时也不会插值出不存在的值
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(q * len(sorted_vals)) - 1))
+    return sorted_vals[k]
+
+
+class LatencyStats:
+    """最近 window 个样本的 p50/p99（毫秒），按指标名分开统计。"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+
+    def observe(self, name: str, value_ms: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(value_ms)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Optional[float]]]:
+        with self._lock:
+            out = {}
+            for name, samples in self._samples.items():
+                vals = sorted(samples)
+                out[name] = {
+                    "count": self._counts[name],
+                    "p50_ms": _percentile(vals, 0.50),
+                    "p99_ms": _percentile(vals, 0.99),
+                    "max_ms": vals[-1] if vals else None,
+                }
+            return out
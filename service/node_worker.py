@@ -0,0 +1,176 @@
+# service/node_worker.py
+# 分布式模式下的单个工作节点：从共享 SqliteJobStore 领取作业，持租约跑 run_pipeline，
+# 后台线程定期心跳续租；每完成一个阶段写 checkpoint，节点崩溃后其它节点从断点续跑。
+#
+# 用法（每台机器各起一个或多个）：
+#   python -m service.node_worker --db /mnt/shared/jobs.db --jobs-root /mnt/shared/jobs
+#   python -m service.node_worker --db /mnt/shared/jobs.db --jobs-root /mnt/shared/jobs submit a.mht b.mht
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from service.job_store import LeaseLost, SqliteJobStore, StoredJob
+from service.metrics import LatencyStats
+
+
+class _Heartbeat:
+    """后台续租；续租失败（租约被回收/作业被取消）后置 lost，主线程在下一个阶段边界放弃。"""
+
+    def __init__(self, store: SqliteJobStore, job_id: str, node_id: str,
+                 lease_seconds: float, interval: float):
+        self.store = store
+        self.job_id = job_id
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval
+        self.lost: Optional[LeaseLost] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.heartbeat(self.job_id, self.node_id, self.lease_seconds)
+            except LeaseLost as e:
+                self.lost = e
+                return
+            except Exception as e:
+                # 共享库暂时不可用：继续重试，租约到期前恢复就不影响
+                print(f"[node] heartbeat error for {self.job_id}: {type(e).__name__}: {e}")
+
+
+class NodeWorker:
+    """
+    lease_seconds: 租约时长；heartbeat 默认每 lease/3 秒续一次，容忍两次心跳失败
+    OCR 解释器第一次用到时创建，之后所有作业共用（同 WarmWorkerPool 的预热思路）。
+    """
+
+    def __init__(self, store: SqliteJobStore, node_id: Optional[str] = None,
+                 engine: str = "tesseract", lang: str = "chi_sim+eng",
+                 lease_seconds: float = 60.0, heartbeat_interval: Optional[float] = None,
+                 poll_interval: float = 2.0):
+        self.store = store
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.engine = engine
+        self.lang = lang
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval or lease_seconds / 3
+        self.poll_interval = poll_interval
+        self.metrics = LatencyStats()
+        self._stop = threading.Event()
+        self._ocr = None
+
+    def _interpreter(self):
+        if self._ocr is None:
+            from semantics.image_semantics import create_interpreter
+            self._ocr = create_interpreter(self.engine, lang=self.lang)
+        return self._ocr
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_forever(self) -> None:
+        print(f"[node] {self.node_id} polling {self.store.root}")
+        while not self._stop.is_set():
+            if not self.run_once():
+                self._stop.wait(self.poll_interval)
+
+    def run_once(self) -> bool:
+        """领取并处理一个作业；队列为空返回 False。"""
+        job = self.store.claim(self.node_id, self.lease_seconds)
+        if job is None:
+            return False
+        self._process(job)
+        return True
+
+    def _process(self, job: StoredJob) -> None:
+        from pipeline import run_pipeline
+
+        resumed = list(job.completed_stages)
+        print(f"[node] {self.node_id} claimed {job.job_id} (attempt {job.attempts}, done stages: {resumed or '-'})")
+        t0 = time.perf_counter()
+        error: Optional[str] = None
+
+        with _Heartbeat(self.store, job.job_id, self.node_id, self.lease_seconds, self.heartbeat_interval) as hb:
+            def fence(stage: str) -> None:
+                # 写共享目录前做一次带 lease_owner 条件的续租：失败说明租约已归别人，直接放弃；
+                # 成功则至少还有 lease_seconds 的独占期，足够把这一阶段的产物写完
+                if hb.lost:
+                    raise hb.lost
+                self.store.heartbeat(job.job_id, self.node_id, self.lease_seconds)
+
+            def on_stage_done(stage: str, duration_ms: float) -> None:
+                if hb.lost:
+                    raise hb.lost
+                self.store.record_checkpoint(job.job_id, self.node_id, stage, duration_ms)
+                self.metrics.observe(f"stage_{stage}_ms", duration_ms)
+
+            try:
+                run_pipeline(str(self.store.input_path(job)), str(self.store.job_dir(job.job_id)),
+                             image_interpreter=self._interpreter(),
+                             completed_stages=resumed, on_stage_done=on_stage_done, fence=fence)
+            except LeaseLost as e:
+                # 被取消：complete 记为 cancelled；租约已归别的节点：complete 不会生效，状态以新持有者为准
+                print(f"[node] {self.node_id} gave up {job.job_id}: {e}")
+                self.store.complete(job.job_id, self.node_id, error="cancelled")
+                return
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+        self.metrics.observe("run_ms", (time.perf_counter() - t0) * 1000)
+        if not self.store.complete(job.job_id, self.node_id, error=error):
+            print(f"[node] {self.node_id} lost lease on {job.job_id} before completion")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="mht_parser distributed worker node")
+    ap.add_argument("--db", required=True, help="共享存储上的 SQLite 作业库")
+    ap.add_argument("--jobs-root", required=True, help="共享存储上的作业目录根")
+    ap.add_argument("--node-id", default=None)
+    ap.add_argument("--engine", default="tesseract")
+    ap.add_argument("--lang", default="chi_sim+eng")
+    ap.add_argument("--lease", type=float, default=60.0, help="租约秒数")
+    ap.add_argument("--poll", type=float, default=2.0, help="队列为空时的轮询间隔秒数")
+    ap.add_argument("command", nargs="?", default="run", choices=["run", "submit", "reclaim"])
+    ap.add_argument("files", nargs="*", help="submit 时要入队的 mht 文件")
+    args = ap.parse_args()
+
+    store = SqliteJobStore(args.db, args.jobs_root)
+    if args.command == "submit":
+        for f in args.files:
+            job = store.submit(Path(f).name, Path(f).read_bytes())
+            print(job.job_id, f)
+        return
+    if args.command == "reclaim":
+        print(f"reclaimed {store.reclaim_expired()} jobs; {store.counts()}")
+        return
+
+    worker = NodeWorker(store, node_id=args.node_id, engine=args.engine, lang=args.lang,
+                        lease_seconds=args.lease, poll_interval=args.poll)
+    try:
+        worker.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
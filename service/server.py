@@ -0,0 +1,116 @@
+# service/server.py
+# 本地解析服务：
+#   POST   /jobs?filename=xxx.mht   请求体为原始 mht 字节，返回 {"job_id": ...}
+#   GET    /jobs/{job_id}           作业状态（job.json）
+#   DELETE /jobs/{job_id}           取消作业
+#   GET    /metrics                 p50/p99 延迟、排队/运行中数量
+#
+# 用法：python -m service.server --jobs-root jobs --port 8765 --workers 4
+import argparse
+import json
+import sys
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from service.job_queue import JobQueue
+from service.worker_pool import WarmWorkerPool
+
+# 上传大小上限，防止误传超大文件把磁盘写满
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+
+
+def _make_handler(queue: JobQueue, pool: WarmWorkerPool):
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, code: int, obj) -> None:
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _job_id(self):
+            parts = [p for p in urlparse(self.path).path.split("/") if p]
+            if len(parts) == 2 and parts[0] == "jobs":
+                return parts[1]
+            return None
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/jobs":
+                return self._send_json(404, {"error": "not found"})
+
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0:
+                return self._send_json(400, {"error": "empty body"})
+            if length > MAX_UPLOAD_BYTES:
+                return self._send_json(413, {"error": f"upload larger than {MAX_UPLOAD_BYTES} bytes"})
+
+            filename = (parse_qs(url.query).get("filename") or ["upload.mht"])[0]
+            rec = queue.create(filename, self.rfile.read(length))
+            pool.notify()
+            return self._send_json(202, {"job_id": rec.job_id, "status": rec.status})
+
+        def do_GET(self):
+            if urlparse(self.path).path.rstrip("/") == "/metrics":
+                return self._send_json(200, {
+                    "latency": pool.metrics.snapshot(),
+                    "queued": len(queue.pending()),
+                    "running": pool.in_flight(),
+                    "workers": pool.workers,
+                })
+
+            job_id = self._job_id()
+            rec = queue.get(job_id) if job_id else None
+            if rec is None:
+                return self._send_json(404, {"error": "job not found"})
+            return self._send_json(200, asdict(rec))
+
+        def do_DELETE(self):
+            job_id = self._job_id()
+            rec = queue.request_cancel(job_id) if job_id else None
+            if rec is None:
+                return self._send_json(404, {"error": "job not found"})
+            return self._send_json(200, asdict(rec))
+
+        def log_message(self, fmt, *args):
+            print(f"[service] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+
+def serve(jobs_root: str = "jobs", host: str = "127.0.0.1", port: int = 8765,
+          workers: int = 2, engine: str = "tesseract", lang: str = "chi_sim+eng") -> None:
+    queue = JobQueue(jobs_root)
+    pool = WarmWorkerPool(queue, workers=workers, engine=engine, lang=lang)
+    pool.start()
+    pool.notify()  # 重启前遗留的 queued 作业
+
+    httpd = ThreadingHTTPServer((host, port), _make_handler(queue, pool))
+    print(f"[service] listening on http://{host}:{port} jobs_root={jobs_root} workers={workers}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="mht_parser local parsing service")
+    ap.add_argument("--jobs-root", default="jobs")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--engine", default="tesseract")
+    ap.add_argument("--lang", default="chi_sim+eng")
+    args = ap.parse_args()
+    serve(args.jobs_root, args.host, args.port, args.workers, args.engine, args.lang)
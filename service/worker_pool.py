@@ -0,0 +1,154 @@
+# service/worker_pool.py
+# 预热的常驻进程池：bs4/lxml/PIL/pytesseract 和 OCR 解释器在子进程启动时加载一次，
+# 之后每个作业直接跑 run_pipeline，不再付冷启动成本。
+import json
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional
+
+from service.job_queue import JobQueue
+from service.metrics import LatencyStats
+
+_WORKER_OCR = None
+
+
+def _warm_up(engine: str, lang: str) -> None:
+    global _WORKER_OCR
+    import bs4
+    import pipeline  # noqa: F401  连带导入 semantics/mht_parser
+    try:
+        import PIL.Image  # noqa: F401
+        import pytesseract  # noqa: F401
+    except ImportError:
+        pass  # 缺依赖时 OcrInterpreter 会返回带 error 的结果，不影响进程启动
+
+    from semantics.image_semantics import create_interpreter
+    _WORKER_OCR = create_interpreter(engine, lang=lang)
+
+    # 让 lxml 解析器先跑一遍
+    bs4.BeautifulSoup("<table><tr><td>warm</td></tr></table>", "lxml")
+
+
+class JobCancelled(RuntimeError):
+    """运行中的作业被取消：在下一个阶段边界中止，不再继续 OCR 和写产物。"""
+
+
+def _check_cancel(job_dir: str) -> None:
+    # 子进程拿不到父进程里的 JobQueue，取消标记从 job.json 读（request_cancel 会立即写回）
+    try:
+        rec = json.loads((Path(job_dir) / "job.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return
+    if rec.get("cancel_requested"):
+        raise JobCancelled(f"job {rec.get('job_id')} cancelled")
+
+
+def _run_job(mht_path: str, job_dir: str) -> float:
+    from pipeline import run_pipeline
+
+    t0 = time.perf_counter()
+    run_pipeline(mht_path, job_dir, image_interpreter=_WORKER_OCR,
+                 fence=lambda stage: _check_cancel(job_dir),
+                 on_stage_done=lambda stage, ms: _check_cancel(job_dir))
+    return (time.perf_counter() - t0) * 1000
+
+
+class WarmWorkerPool:
+    """
+    调度线程从 JobQueue 取 queued 作业，保证同时在跑的作业不超过 workers 个。
+    - 排队中的作业取消：直接标记 cancelled，调度时跳过
+    - 运行中的作业取消：在下一个阶段边界（写产物前/阶段完成后）中止，状态记为 cancelled
+    """
+
+    def __init__(self, queue: JobQueue, workers: int = 2,
+                 engine: str = "tesseract", lang: str = "chi_sim+eng"):
+        self.queue = queue
+        self.workers = workers
+        self.engine = engine
+        self.lang = lang
+        self.metrics = LatencyStats()
+
+        self._executor = self._new_executor()
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   initializer=_warm_up,
+                                   initargs=(self.engine, self.lang))
+
+    def start(self) -> None:
+        # 提前把子进程拉起来完成预热，第一个作业不用等
+        for f in [self._executor.submit(time.sleep, 0) for _ in range(self.workers)]:
+            f.result()
+        self._thread = threading.Thread(target=self._dispatch_loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._in_flight)
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(timeout=0.5)
+            self._wake.clear()
+
+            for rec in self.queue.pending():
+                if self.in_flight() >= self.workers:
+                    break
+                if not self.queue.mark_running(rec.job_id):
+                    continue  # 已被取消
+                self._submit(rec.job_id)
+
+    def _submit(self, job_id: str) -> None:
+        mht_path = str(self.queue.input_path(job_id))
+        job_dir = str(self.queue.job_dir(job_id))
+        try:
+            try:
+                fut = self._executor.submit(_run_job, mht_path, job_dir)
+            except BrokenProcessPool:
+                # 有子进程崩溃（如 OCR 段错误）：重建进程池后再提交
+                self._executor = self._new_executor()
+                fut = self._executor.submit(_run_job, mht_path, job_dir)
+        except Exception as e:
+            # 重建后仍提交失败：作业记为失败，不能让调度线程退出、作业永远停在 running
+            self.queue.mark_finished(job_id, error=f"submit failed: {type(e).__name__}: {e}")
+            return
+
+        with self._lock:
+            self._in_flight[job_id] = fut
+        fut.add_done_callback(lambda f, jid=job_id: self._on_done(jid, f))
+
+    def _on_done(self, job_id: str, fut: Future) -> None:
+        error = None
+        timings: Dict[str, float] = {}
+        try:
+            timings["run_ms"] = fut.result()
+            self.metrics.observe("run_ms", timings["run_ms"])
+        except JobCancelled:
+            pass  # mark_finished 按 cancel_requested 记为 cancelled
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+        rec = self.queue.mark_finished(job_id, error=error, timings_ms=timings)
+        self.metrics.observe("latency_ms", rec.timings_ms["latency_ms"])
+
+        with self._lock:
+            self._in_flight.pop(job_id, None)
+        self._wake.set()